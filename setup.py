@@ -10,7 +10,9 @@ def main():
           author="Zhu Junling",
           author_email="jl.zhu@tom.com",
           packages=["sm2"],
-          requires=["sm3"]
+          package_data={"sm2": ["cache.bin"]},
+          requires=["sm3"],
+          extras_require={"gmpy2": ["gmpy2"]}
     )
 
 if __name__ == "__main__":
@@ -1,5 +1,19 @@
 from .sm2 import (
     SM2, SM2PrivateKey, SM2Error, ASN1Error
 )
+from .nonce import NoncePool
+from .registry import KeyRegistry
 
 __version__ = '1.1.0'
+
+
+def __getattr__(name):
+    ''' 延迟导入: SM2Pool及SharedTables首次使用时才导入(导入较慢) '''
+    # pylint: disable=import-outside-toplevel
+    if name == 'SM2Pool':
+        from .pool import SM2Pool
+        return SM2Pool
+    if name == 'SharedTables':
+        from .shared import SharedTables
+        return SharedTables
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,101 @@
+#-*-coding:utf8;-*-
+''' asyncio前端: SM2运算在执行器中进行, 不阻塞事件循环 '''
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from .sm2 import SM2Error
+from .pool import SM2Pool, run_batch
+
+
+class AsyncSM2:
+    '''
+        SM2 异步加密/解密, 签名/验签
+        target: SM2对象(在线程执行器中运算)或SM2Pool(在工作进程中运算)
+        executor: target为SM2对象时使用的执行器, 默认使用事件循环的默认执行器
+        (不支持进程执行器: 每批都要序列化SM2对象, 多进程请使用SM2Pool)
+        同一事件循环周期内(或batch_delay秒内)到达的同类请求合并为一批执行,
+        一批最多batch_size个; 未完成的请求最多max_pending个, 超出时
+        overflow='wait'等待, overflow='reject'抛出SM2Error
+    '''
+    __slots__ = ['target', 'executor', 'max_pending', 'batch_size',
+                 'batch_delay', 'overflow', 'semaphore', 'pending', 'handles', 'tasks']
+
+    def __init__(self, target, executor=None, max_pending=1024, batch_size=64,
+                 batch_delay=0, overflow='wait'):
+        if overflow not in {'wait', 'reject'}:
+            raise ValueError('The overflow should be wait or reject.')
+        if isinstance(executor, ProcessPoolExecutor):
+            raise ValueError('Use SM2Pool as the target instead of a process executor.')
+        self.target = target
+        self.executor = executor
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.overflow = overflow
+        self.semaphore = None
+        self.pending = {}
+        self.handles = {}
+        self.tasks = set()
+
+    async def sign(self, data):
+        ''' 签名函数, data: 待签名的消息(bytes) '''
+        return await self._request('sign', (data,))
+
+    async def verify(self, sign, data):
+        ''' 验签函数, sign: 签名r||s, data: 待验签的消息(bytes) '''
+        return await self._request('verify', (sign, data))
+
+    async def encrypt(self, plaintext, mode='asn1'):
+        ''' 加密函数, plaintext: 明文(bytes) '''
+        return await self._request('encrypt', (plaintext, mode))
+
+    async def decrypt(self, data, mode='asn1'):
+        ''' 解密函数, data: 密文(bytes) '''
+        return await self._request('decrypt', (data, mode))
+
+    async def _request(self, operation, args):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_pending)
+        if self.overflow == 'reject' and self.semaphore.locked():
+            raise SM2Error('Too many pending requests.')
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            pending = self.pending.setdefault(operation, [])
+            pending.append((args, future))
+            if len(pending) >= self.batch_size:
+                self._flush(operation)
+            elif len(pending) == 1:
+                self.handles[operation] = \
+                    loop.call_later(self.batch_delay, self._flush, operation) \
+                    if self.batch_delay else loop.call_soon(self._flush, operation)
+            return await future
+
+    def _flush(self, operation):
+        ''' 把积累的同类请求作为一批提交 '''
+        if handle := self.handles.pop(operation, None):
+            handle.cancel()
+        items = self.pending.pop(operation, None)
+        if not items:
+            return
+        task = asyncio.get_running_loop().create_task(self._dispatch(operation, items))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _dispatch(self, operation, items):
+        chunk = [args for args, _ in items]
+        try:
+            if isinstance(self.target, SM2Pool):
+                results = await asyncio.wrap_future(
+                    self.target.submit_batch(operation, chunk, True))
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, run_batch, self.target, operation, chunk, True)
+        except Exception as ex:  # pylint: disable=broad-except
+            results = [(ex, None)] * len(items)
+        for (_, future), (error, result) in zip(items, results):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,303 @@
+#-*-coding:utf8;-*-
+''' 性能测试: python -m sm2.bench [-o result.json] [-c old.json new.json] [测试项 ...] '''
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from functools import partial
+from time import perf_counter, perf_counter_ns
+from . import __version__
+from .fieldp import FP, SolinasPrime
+from .engine import JacobianEngine
+from .kdf import bitxor, kdf
+from .sm2 import CurveSM2, SM2, ASN1
+
+
+def measure(func, rounds):
+    ''' 执行rounds次, 返回每次的平均耗时(秒) '''
+    start = perf_counter()
+    for _ in range(rounds):
+        func()
+    return (perf_counter() - start) / rounds
+
+
+def bench_reduce(rounds=2000):
+    ''' 取模运算: CPython的% 与 Solinas折叠约简 '''
+    solinas = SolinasPrime(CurveSM2.P, FP.solinas_terms(CurveSM2.P))
+    print(f'selected: {type(CurveSM2.ENGINE.prime).__name__}')
+    for bits in (257, 320, 384, 448, 512):
+        time_mod, time_fold = FP.bench_reduce(solinas, rounds, bits)
+        winner = 'solinas' if time_fold < time_mod else '%'
+        print(f'reduce {bits:3d} bits  %: {time_mod*1e9:8.1f} ns  '
+              f'solinas: {time_fold*1e9:8.1f} ns  -> {winner}')
+
+    point = CurveSM2.BASE.to_point()
+    for name, prime in (('%', CurveSM2.P), ('solinas', solinas)):
+        engine = JacobianEngine(CurveSM2.P, CurveSM2.A)
+        engine.prime = prime
+        point2 = engine.double(point)
+        time_dbl = measure(partial(engine.double, point2), rounds)
+        time_add = measure(partial(engine.madd, point2, CurveSM2.GX, CurveSM2.GY), rounds)
+        print(f'{name:>8}  double: {time_dbl*1e6:8.2f} us  madd: {time_add*1e6:8.2f} us')
+
+
+def bench_sign_many(count=200):
+    ''' 批量签名吞吐量: sign 与 sign_many '''
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key(), private_key)
+    datas = [i.to_bytes(4, 'big') * 16 for i in range(count)]
+    sm2.sign(datas[0])
+    time_one = measure(lambda: [sm2.sign(data) for data in datas], 1)
+    time_many = measure(lambda: sm2.sign_many(datas), 1)
+    print(f'sign      : {count/time_one:8.1f} ops/s')
+    print(f'sign_many : {count/time_many:8.1f} ops/s')
+
+
+def bench_window(windows=(2, 3, 4, 5, 6, 7, 8), rounds=200):
+    ''' 预计算表窗口宽度: 建表耗时, 内存占用与倍乘延迟的关系 '''
+    kkks = [CurveSM2.random() for _ in range(rounds)]
+    print(f'{"window":>6} {"points":>7} {"memory":>10} {"build":>10} {"mul":>10}')
+    for window in windows:
+        start = perf_counter()
+        cache = CurveSM2.create_cache(CurveSM2.BASE, window)
+        time_build = perf_counter() - start
+        time_mul = measure(lambda cache=cache, kkk=iter(kkks):
+                           CurveSM2.tmul_point(cache, next(kkk)), rounds)
+        print(f'{window:6d} {len(cache):7d} {cache.nbytes/1024:7.1f} KB '
+              f'{time_build*1e3:7.1f} ms {time_mul*1e6:7.1f} us')
+    point = CurveSM2.gmul(CurveSM2.random())
+    time_wnaf = measure(lambda: point * CurveSM2.random(), rounds // 10 or 1)
+    print(f'{"wnaf":>6} {"-":>7} {"-":>10} {"-":>10} {time_wnaf*1e6:7.1f} us')
+
+
+def bench_payload(sizes=(16, 256, 4 << 10, 64 << 10, 1 << 20, 16 << 20)):
+    ''' 加密/解密各部分耗时与明文长度的关系: KDF, 异或, 整体加密/解密 '''
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key(), private_key)
+    z_bits = bytes(64)
+    print(f'{"size":>9} {"kdf":>12} {"xor":>12} {"encrypt":>12} {"decrypt":>12}')
+    for size in sizes:
+        data = os.urandom(size)
+        rounds = max(1, (1 << 20) // size)
+        time_kdf = measure(partial(kdf, z_bits, size), rounds)
+        time_xor = measure(partial(bitxor, data, data), rounds)
+        ciphertext = sm2.encrypt(data, 'c1c3c2')
+        time_enc = measure(partial(sm2.encrypt, data, 'c1c3c2'), rounds)
+        time_dec = measure(partial(sm2.decrypt, ciphertext, 'c1c3c2'), rounds)
+        print(f'{size:9d} ' + ' '.join(
+            f'{size / value / (1 << 20):7.1f} MB/s'
+            for value in (time_kdf, time_xor, time_enc, time_dec)))
+
+
+BENCHES = {
+    'reduce': bench_reduce,
+    'window': bench_window,
+    'payload': bench_payload,
+    'sign_many': bench_sign_many,
+}
+
+
+def sample(func, min_time=0.2, max_rounds=10000, min_rounds=5):
+    '''
+        逐次计时执行func, 直到累计min_time秒(至少min_rounds次, 至多max_rounds次)
+        返回ops/s, 平均值及百分位数(微秒), 以及单次执行的峰值内存(KB)
+    '''
+    func()
+    times = []
+    total = 0
+    while len(times) < min_rounds or total < min_time and len(times) < max_rounds:
+        start = perf_counter_ns()
+        func()
+        times.append(perf_counter_ns() - start)
+        total += times[-1] / 1e9
+    times.sort()
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    count = len(times)
+    return {
+        'rounds': count,
+        'ops': count / total,
+        'mean_us': sum(times) / count / 1e3,
+        'min_us': times[0] / 1e3,
+        'p50_us': times[count // 2] / 1e3,
+        'p90_us': times[min(count - 1, count * 9 // 10)] / 1e3,
+        'p99_us': times[min(count - 1, count * 99 // 100)] / 1e3,
+        'max_us': times[-1] / 1e3,
+        'peak_kb': peak / 1024,
+    }
+
+
+def import_time(code, rounds=5):
+    ''' 在子进程中执行code(打印耗时秒数), 返回统计结果 '''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    times = sorted(float(subprocess.run(
+        [sys.executable, '-c', code], env=env, check=True,
+        capture_output=True, text=True).stdout) * 1e6 for _ in range(rounds))
+    return {
+        'rounds': rounds,
+        'ops': rounds * 1e6 / sum(times),
+        'mean_us': sum(times) / rounds,
+        'min_us': times[0],
+        'p50_us': times[rounds // 2],
+        'p90_us': times[min(rounds - 1, rounds * 9 // 10)],
+        'p99_us': times[-1],
+        'max_us': times[-1],
+        'peak_kb': None,
+    }
+
+
+IMPORT_CODE = '''
+from time import perf_counter
+start = perf_counter()
+import sm2
+%s
+print(perf_counter() - start)
+'''
+
+
+def suite_cases(sizes=(16, 1 << 10, 64 << 10)):
+    ''' 生成测试用例: (名称, 函数) '''
+    # pylint: disable=too-many-locals,protected-access
+    private_key = SM2.create_private_key()
+    public_key = private_key.public_key()
+    sm2_s = SM2(public_key, private_key)
+    sm2_p = SM2(public_key)
+    sm2_c = SM2(public_key, use_cache=True)
+    point = CurveSM2.gmul(CurveSM2.random())
+    point2 = CurveSM2.gmul(CurveSM2.random())
+    engine = CurveSM2.ENGINE
+    epoint = engine.double(point.to_point())
+    randoms = iter(CurveSM2.random, None)
+    prime = CurveSM2.P
+    value = CurveSM2.random()
+    square = value * value % prime
+    data = b'benchmark message' * 4
+    signed = sm2_s.sign(data)
+
+    yield 'curve.gmul', lambda: CurveSM2.gmul(next(randoms))
+    yield 'curve.mul', lambda: point * next(randoms)
+    yield 'curve.gmul_add', lambda: CurveSM2.gmul_add(next(randoms), next(randoms), point)
+    yield 'engine.double', partial(engine.double, epoint)
+    yield 'engine.madd', partial(engine.madd, epoint, point2.coord_x, point2.coord_y)
+    yield 'curve.create_cache', lambda: CurveSM2.create_cache(CurveSM2.BASE)
+    yield 'fp.invn', lambda: FP.invn(prime, value)
+    yield 'fp.pown', lambda: FP.pown(prime, value, prime - 2)
+    yield 'fp.sqrtp', lambda: FP.sqrtp(prime, square)
+    yield 'sm2.sign', lambda: sm2_s.sign(data)
+    yield 'sm2.verify', lambda: sm2_p.verify(signed, data)
+    yield 'sm2.verify_cached', lambda: sm2_c.verify(signed, data)
+    for mode in ('asn1', 'c1c3c2', 'c1c2c3', 'c1c2'):
+        for size in sizes:
+            plaintext = os.urandom(size)
+            ciphertext = sm2_p.encrypt(plaintext, mode)
+            yield f'sm2.encrypt.{mode}.{size}', partial(sm2_p.encrypt, plaintext, mode)
+            yield f'sm2.decrypt.{mode}.{size}', partial(sm2_s.decrypt, ciphertext, mode)
+    ciphertext = sm2_p.encrypt(os.urandom(sizes[-1]), 'asn1')
+    yield 'asn1.encode_signature', lambda: ASN1.encode_sequence(
+        ASN1.encode_int(value), ASN1.encode_int(square))
+    yield 'asn1.decode_signature', lambda: SM2._decode_signed_asn1(signed)
+    yield f'asn1.decode_ciphertext.{sizes[-1]}', \
+        lambda: SM2._decode_ciphertext_asn1(ciphertext)
+
+
+def run_suite(pattern=None, min_time=0.2):
+    ''' 执行测试套件, 返回可保存为JSON的结果 '''
+    # pylint: disable=protected-access
+    results = {}
+    imports = {
+        'import.sm2': IMPORT_CODE % '',
+        'import.init_cache': IMPORT_CODE % 'sm2.sm2.CurveSM2.init_cache()',
+    }
+    for name, code in imports.items():
+        if not pattern or pattern in name:
+            print(name, file=sys.stderr)
+            results[name] = import_time(code)
+    for name, func in suite_cases():
+        if not pattern or pattern in name:
+            print(name, file=sys.stderr)
+            results[name] = sample(func, min_time)
+    return {
+        'meta': {
+            'version': __version__,
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'engine': type(CurveSM2.ENGINE).__name__,
+            'reduce': type(CurveSM2.ENGINE.prime).__name__,
+            'backend': FP.BACKEND,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    ''' 比较两个结果文件的p50耗时, 返回变慢超过threshold的测试项 '''
+    with open(old, encoding='utf8') as file:
+        old = json.load(file)['results']
+    with open(new, encoding='utf8') as file:
+        new = json.load(file)['results']
+    print(f'{"name":<32} {"old p50":>12} {"new p50":>12} {"change":>8}')
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name]['p50_us'], new[name]['p50_us']
+        change = after / before - 1
+        flag = ''
+        if change > threshold:
+            flag = '  SLOWER'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = '  faster'
+        print(f'{name:<32} {before:9.1f} us {after:9.1f} us {change:+7.1%}{flag}')
+    for name in sorted(old.keys() ^ new.keys()):
+        print(f'{name:<32} only in {"old" if name in old else "new"}')
+    return regressions
+
+
+def main(argv):
+    ''' Entry of script '''
+    parser = argparse.ArgumentParser(
+        prog='python -m sm2.bench',
+        description='SM2性能测试, 默认执行测试套件并输出JSON')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f'单项测试(表格输出): {", ".join(sorted(BENCHES))}')
+    parser.add_argument('-o', '--output', help='测试套件结果保存到JSON文件')
+    parser.add_argument('-k', '--filter', help='只执行名称包含此字符串的用例')
+    parser.add_argument('-t', '--min-time', type=float, default=0.2,
+                        help='每个用例的最短计时(秒)')
+    parser.add_argument('-c', '--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='比较两个结果文件, 有用例变慢时返回1')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='比较时视为变慢的比例')
+    args = parser.parse_args(argv)
+    # nargs='*'的位置参数不能用choices(不给名称时空列表也会被拒绝), 在此检查
+    if unknown := [name for name in args.names if name not in BENCHES]:
+        parser.error(f'invalid choice: {", ".join(unknown)} '
+                     f'(choose from {", ".join(sorted(BENCHES))})')
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+    if args.names:
+        for name in args.names:
+            print(f'== {name}')
+            BENCHES[name]()
+        return 0
+    result = json.dumps(run_suite(args.filter, args.min_time), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as file:
+            file.write(result + '\n')
+    else:
+        print(result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,14 @@
 #-*-coding:utf8;-*-
 ''' 素数域上的椭圆曲线(Curve) '''
+import os
+import mmap
+import struct
+import hashlib
+import warnings
+from itertools import chain
 from secrets import randbelow
 from .fieldp import FP
+from .engine import select_engine, wnaf
 
 
 class CurveError(Exception):
@@ -9,7 +16,7 @@ class CurveError(Exception):
     __slots__ = ['coord_x', 'coord_y']
 
     def __init__(self, coord_x, coord_y):
-        super().__init__()
+        super().__init__(coord_x, coord_y)
         self.coord_x = coord_x
         self.coord_y = coord_y
 
@@ -17,6 +24,33 @@ class CurveError(Exception):
         return f'({self.coord_x:#x}, {self.coord_y:#x}) not on the elliptic curve.'
 
 
+class CacheError(Exception):
+    ''' 缓存文件错误 '''
+    __slots__ = ['msg']
+
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.msg = msg
+
+    def __str__(self):
+        return self.msg
+
+
+def env_window(name, default=8):
+    ''' 读取窗口宽度的环境变量: 不是1..16的整数时警告并使用默认值 '''
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        window = int(value)
+    except ValueError:
+        window = 0
+    if not 0 < window <= 16:
+        warnings.warn(f'{name}={value} should be in 1..16, using {default}.')
+        return default
+    return window
+
+
 class Curve:
     ''' 素数域上的椭圆曲线计算 '''
     __slots__ = ['coord_x', 'coord_y', 'coord_z']
@@ -27,7 +61,17 @@ class Curve:
     GX = 0x32C4AE2C1F1981195F9904466A39C9948FE30BBFF2660BE1715A4589334C74C7
     GY = 0xBC3736A2F4F6779C59BDCEE36B692153D0A9877CC62A474002DF32E52139F0A0
     LEN = (P.bit_length() + 7) >> 3
-    CACHE = []
+    CACHE = None
+    # 基点预计算表的窗口宽度: 表有ceil(256/w)*2^w个点, 倍乘需ceil(256/w)次点加
+    CACHE_WINDOW = env_window('SM2_CACHE_WINDOW')
+    # 变基点倍乘(wNAF)的窗口宽度, 预计算2^(w-2)个奇数倍点
+    WNAF_WIDTH = 5
+    # 基点缓存文件: 不存在时首次计算后写入, 下次启动直接加载
+    CACHE_FILE = os.environ.get('SM2_CACHE_FILE')
+    # 随包发布的预计算基点缓存(可选)
+    CACHE_PACKAGED = os.path.join(os.path.dirname(__file__), 'cache.bin')
+    CACHE_MAGIC = b'SM2T'
+    CACHE_HEADER = struct.Struct('>4sBBH32s32s')
 
     @classmethod
     def random(cls):
@@ -121,20 +165,55 @@ class Curve:
 
     def __mul__(self, kkk):
         ''' 椭圆曲线倍乘运算 '''
-        # GB/T 32918.1 A.3.2 算法二
+        return self.wmul(kkk)
+
+    def wmul(self, kkk, width=None):
+        '''
+            椭圆曲线倍乘运算: 宽度为w的NAF, 每次调用预计算奇数倍点P, 3P, ...
+            w=2即GB/T 32918.1 A.3.2 算法二
+        '''
         kkk %= self.N
-        hbits = f'{kkk*3:b}'
-        bitlen = len(hbits)
-        kbits = f'{kkk:{bitlen}b}'
-        negec = self.__neg__()
-        result = self.copy()
-        for i in range(1, bitlen-1):
-            result.fast_double()
-            if hbits[i] == '1' and kbits[i] != '1':
-                result.fast_add(self)
-            elif hbits[i] != '1' and kbits[i] == '1':
-                result.fast_add(negec)
-        return result.to_affine()
+        if kkk == 0 or self.coord_x == 0 and self.coord_y == 0:
+            return self.ZERO.copy()
+        width = width or self.WNAF_WIDTH
+        return self.from_point(self.wnaf_point(wnaf(kkk, width), self.odd_multiples(width)))
+
+    @classmethod
+    def wnaf_point(cls, digits, odds):
+        ''' 按wNAF数字(低位在前)及奇数倍点累加, 返回运算引擎的坐标元组 '''
+        engine = cls.ENGINE
+        prime = cls.P
+        result = engine.INF
+        for digit in reversed(digits):
+            result = engine.double(result)
+            if digit:
+                c2x, c2y = odds[abs(digit) >> 1]
+                result = engine.madd(result, c2x, c2y if digit > 0 else prime - c2y)
+        return result
+
+    @classmethod
+    def mul_many(cls, points, kkk, width=None):
+        '''
+            批量倍乘: 多个点乘同一个数(如私钥), 返回仿射坐标的对象列表
+            各点的奇数倍点及所有结果各共用一次模逆运算
+        '''
+        kkk %= cls.N
+        width = width or cls.WNAF_WIDTH
+        count = 1 << (width - 2)
+        engine = cls.ENGINE
+        chains = []
+        for point in points:
+            chains.extend(engine.odd_chain(point.to_point(), count))
+        odds = engine.batch_affine(chains)
+        digits = wnaf(kkk, width)
+        results = [cls.wnaf_point(digits, odds[pos:pos+count])
+                   for pos in range(0, len(odds), count)]
+        return [cls(c1x, c1y, False) for c1x, c1y in engine.batch_affine(results)]
+
+    def odd_multiples(self, width=None):
+        ''' 计算wNAF使用的奇数倍点P, 3P, ...共2^(w-2)个(仿射坐标) '''
+        width = width or self.WNAF_WIDTH
+        return self.ENGINE.odd_multiples(self.to_point(), 1 << (width - 2))
 
     def __rmul__(self, kkk):
         ''' 椭圆曲线乘法运算, 对象在右侧 '''
@@ -175,6 +254,25 @@ class Curve:
         newobj.coord_z = self.coord_z
         return newobj
 
+    def to_point(self):
+        ''' 转换为运算引擎的坐标元组 '''
+        if self.coord_x == 0 and self.coord_y == 0 or self.coord_z == 0:
+            return self.ENGINE.INF
+        return self.ENGINE.from_projective(
+            (self.coord_x, self.coord_y, self.coord_z))
+
+    @classmethod
+    def from_point(cls, point, affine=True):
+        ''' 从运算引擎的坐标元组转换为对象 '''
+        if affine:
+            return cls(*cls.ENGINE.to_affine(point), False)
+        if point[2] == 0:
+            return cls.ZERO.copy()
+        newobj = cls(0, 0, False)
+        newobj.coord_x, newobj.coord_y, newobj.coord_z = \
+            cls.ENGINE.to_projective(point)
+        return newobj
+
     def to_affine(self):
         ''' 转换为仿射坐标 '''
         z_inv = FP.invn(self.P, self.coord_z)
@@ -237,35 +335,242 @@ class Curve:
     @classmethod
     def gmul(cls, kkk, affine=True):
         ''' 椭圆曲线基点倍乘运算: G * k '''
-        if not cls.CACHE:
-            return cls.BASE * kkk
-        result = cls.ZERO.copy()
-        for i in range(32):
-            result.fast_add(cls.CACHE[i][kkk & 0xFF])
-            kkk >>= 8
-        return result.to_affine() if affine else result
+        return cls.tmul(cls.CACHE or cls.init_cache(), kkk, affine)
 
     @classmethod
-    def create_cache(cls, base):
-        ''' 生成椭圆曲线缓存: 32*256 '''
-        cache = []
-        base2 = base.copy()
-        for i in range(32):
-            cache2 = []
-            for _ in range(8):
-                cache2.append(base2.copy())
-                base2.fast_double()
-            cache.append([])
-            for j in range(256):
-                result = cls.ZERO.copy()
-                for k in range(8):
-                    if j & 1:
-                        result.fast_add(cache2[k])
-                    if not (j := j >> 1):
-                        break
-                cache[i].append(result)
-        return cache
+    def gmul_add(cls, kkk, lll, point, cache=None, affine=True):
+        ''' 计算 G * k + P * l, 两个倍乘共用一条倍点链 '''
+        return cls.from_point(cls.gmul_add_point(kkk, lll, point, cache), affine)
 
+    @classmethod
+    def gmul_add_point(cls, kkk, lll, point, cache=None, odds=None):
+        '''
+            计算 G * k + P * l, 返回运算引擎的坐标元组
+            两个倍乘共用一条倍点链(Straus-Shamir交错wNAF), G的奇数倍点直接取自
+            基点缓存的第0行; P有缓存时直接查表累加; odds为预先算好的P的奇数倍点
+        '''
+        engine = cls.ENGINE
+        gcache = cls.CACHE or cls.init_cache()
+        if cache:
+            result = engine.INF
+            for c2x, c2y in chain(gcache.points(kkk), cache.points(lll)):
+                result = engine.madd(result, c2x, c2y)
+            return result
+
+        lll %= cls.N
+        if lll == 0 or point.coord_x == 0 and point.coord_y == 0:
+            return cls.tmul_point(gcache, kkk)
+        podd = odds or point.odd_multiples()
+        gdigits = wnaf(kkk % cls.N, gcache.window + 1)
+        pdigits = wnaf(lll, len(podd).bit_length() + 1)
+        bitlen = max(len(gdigits), len(pdigits))
+        gdigits.extend([0] * (bitlen - len(gdigits)))
+        pdigits.extend([0] * (bitlen - len(pdigits)))
+        prime = cls.P
+        result = engine.INF
+        for i in range(bitlen - 1, -1, -1):
+            result = engine.double(result)
+            if digit := gdigits[i]:
+                c2x, c2y = gcache.get(0, abs(digit))
+                result = engine.madd(result, c2x, c2y if digit > 0 else prime - c2y)
+            if digit := pdigits[i]:
+                c2x, c2y = podd[abs(digit) >> 1]
+                result = engine.madd(result, c2x, c2y if digit > 0 else prime - c2y)
+        return result
+
+    @classmethod
+    def tmul(cls, cache, kkk, affine=True):
+        ''' 使用预计算表的倍乘运算 '''
+        return cls.from_point(cls.tmul_point(cache, kkk), affine)
+
+    @classmethod
+    def tmul_point(cls, cache, kkk):
+        ''' 使用预计算表的倍乘运算, 返回运算引擎的坐标元组 '''
+        engine = cls.ENGINE
+        result = engine.INF
+        for c2x, c2y in cache.points(kkk):
+            result = engine.madd(result, c2x, c2y)
+        return result
+
+    @classmethod
+    def gmul_many(cls, kkks):
+        ''' 批量基点倍乘: 只做一次模逆运算转为仿射坐标 '''
+        cache = cls.CACHE or cls.init_cache()
+        points = [cls.tmul_point(cache, kkk) for kkk in kkks]
+        return [cls(c1x, c1y, False) for c1x, c1y in cls.ENGINE.batch_affine(points)]
+
+    @classmethod
+    def create_cache(cls, base, window=8):
+        '''
+            生成椭圆曲线缓存(仿射坐标): 窗口宽度为w时共ceil(256/w)行, 每行2^w个点
+            第i行第j列为 j*2^(w*i)*P, 倍乘时每行查表一次
+        '''
+        if not 0 < window <= 16:
+            raise ValueError('The window should be in 1..16.')
+        engine = cls.ENGINE
+        rows = (cls.N.bit_length() + window - 1) // window
+        points = []
+        base2 = base.to_point()
+        for _ in range(rows):
+            # 每行的基点 2^(w*i)*P 转为仿射坐标, 用混合加法累加
+            c2x, c2y = engine.to_affine(base2)
+            result = engine.INF
+            points.append(result)
+            for _ in range((1 << window) - 1):
+                result = engine.madd(result, c2x, c2y)
+                points.append(result)
+            base2 = engine.madd(result, c2x, c2y)
+        data = bytearray()
+        for c1x, c1y in engine.batch_affine(points):
+            data.extend(c1x.to_bytes(cls.LEN, 'big'))
+            data.extend(c1y.to_bytes(cls.LEN, 'big'))
+        return PointTable(bytes(data), rows, window, cls.LEN)
+
+    @classmethod
+    def init_cache(cls):
+        ''' 首次使用时初始化基点缓存: 优先加载缓存文件, 否则现场计算 '''
+        for path in (cls.CACHE_FILE, cls.CACHE_PACKAGED):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                cache = cls.load_cache(path, cls.BASE)
+            except (OSError, CacheError) as ex:
+                warnings.warn(f'Ignore cache file {path}: {ex}')
+                continue
+            if cache.window == cls.CACHE_WINDOW:
+                cls.CACHE = cache
+                return cls.CACHE
+            if path == cls.CACHE_FILE:
+                warnings.warn(f'Ignore cache file {path}: window {cache.window} '
+                              f'!= {cls.CACHE_WINDOW}')
+        cls.CACHE = cls.create_cache(cls.BASE, cls.CACHE_WINDOW)
+        if cls.CACHE_FILE and not os.path.exists(cls.CACHE_FILE):
+            try:
+                cls.save_cache(cls.CACHE_FILE, cls.CACHE, cls.BASE)
+            except OSError as ex:
+                warnings.warn(f'Cannot write cache file {cls.CACHE_FILE}: {ex}')
+        return cls.CACHE
+
+    @classmethod
+    def cache_digest(cls, base):
+        ''' 计算曲线参数及基点的摘要, 用于校验缓存文件是否匹配 '''
+        params = b''.join(value.to_bytes(cls.LEN, 'big') for value in (
+            cls.P, cls.A, cls.B, cls.N, base.coord_x, base.coord_y))
+        return hashlib.sha256(params).digest()
+
+    @classmethod
+    def save_cache(cls, path, cache=None, base=None):
+        ''' 将缓存序列化到文件: 文件头 + 各行的点(x||y) '''
+        base = base or cls.BASE
+        cache = cache or cls.CACHE or cls.init_cache()
+        body = cache.tobytes()
+        header = cls.cache_header(cache, base)
+        # 先写临时文件再改名, 避免其它进程读到不完整的文件
+        tmpname = f'{path}.{os.getpid()}.tmp'
+        with open(tmpname, 'wb') as file:
+            file.write(header)
+            file.write(body)
+        os.replace(tmpname, path)
+
+    @classmethod
+    def cache_header(cls, cache, base):
+        ''' 生成缓存文件头: 格式, 窗口宽度, 行数, 曲线参数摘要, 内容摘要 '''
+        with memoryview(cache.data) as data:
+            with data[cache.offset:cache.offset+cache.nbytes] as content:
+                digest = hashlib.sha256(content).digest()
+        return cls.CACHE_HEADER.pack(cls.CACHE_MAGIC, 1, cache.window, cache.rows,
+                                     cls.cache_digest(base), digest)
+
+    @classmethod
+    def load_cache(cls, path, base=None):
+        ''' 从文件加载缓存, 校验曲线参数及内容摘要, 尽量使用mmap不复制数据 '''
+        base = base or cls.BASE
+        with open(path, 'rb') as file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                data = file.read()
+        try:
+            return cls.parse_cache(data, base)
+        except CacheError:
+            if isinstance(data, mmap.mmap):
+                data.close()
+            raise
+
+    @classmethod
+    def parse_cache(cls, data, base, size=None, offset=0):
+        '''
+            解析缓存文件内容(bytes, mmap或memoryview), 不复制数据
+            size: 有效数据的结束位置, 默认为整个data(共享内存可能按页对齐有多余字节)
+            offset: 缓存在data中的起始位置
+        '''
+        hlen = offset + cls.CACHE_HEADER.size
+        size = len(data) if size is None else size
+        if size < hlen or len(data) < size:
+            raise CacheError('Cache file truncated.')
+        magic, version, window, rows, params, digest = \
+            cls.CACHE_HEADER.unpack(data[offset:hlen])
+        if magic != cls.CACHE_MAGIC or version != 1 or not 0 < window <= 16 \
+                or rows != (cls.N.bit_length() + window - 1) // window:
+            raise CacheError('Unsupported cache file format.')
+        if params != cls.cache_digest(base):
+            raise CacheError('Cache file not matched the curve.')
+        table = PointTable(data, rows, window, cls.LEN, hlen)
+        if size != hlen + table.nbytes:
+            raise CacheError('Cache file size error.')
+        with memoryview(data) as body:
+            with body[hlen:size] as content:
+                if hashlib.sha256(content).digest() != digest:
+                    raise CacheError('Cache file digest error.')
+        return table
+
+
+class PointTable:
+    ''' 仿射坐标预计算表: 第i行第j列为 j*2^(w*i)*P, 各点x||y连续存放 '''
+    __slots__ = ['data', 'rows', 'window', 'size', 'offset']
+
+    def __init__(self, data, rows, window, size, offset=0):
+        self.data = data
+        self.rows = rows
+        self.window = window
+        self.size = size
+        self.offset = offset
+
+    def __len__(self):
+        return self.rows << self.window
+
+    @property
+    def nbytes(self):
+        ''' 表数据的字节数 '''
+        return len(self) * (self.size << 1)
+
+    def tobytes(self):
+        ''' 转换为字节串 '''
+        return bytes(self.data[self.offset:self.offset+self.nbytes])
+
+    def get(self, row, col):
+        ''' 取第row行第col列的点(x, y) '''
+        plen = self.size << 1
+        pos = self.offset + ((row << self.window) + col) * plen
+        value = int.from_bytes(self.data[pos:pos+plen], 'big')
+        return value >> (self.size << 3), value & ((1 << (self.size << 3)) - 1)
+
+    def points(self, kkk):
+        ''' 按窗口分解k, 依次取出需要累加的点(跳过无穷远点) '''
+        data, window = self.data, self.window
+        mask = (1 << window) - 1
+        plen = self.size << 1
+        bits = self.size << 3
+        ymask = (1 << bits) - 1
+        pos = self.offset
+        for _ in range(self.rows):
+            if col := kkk & mask:
+                pos2 = pos + col * plen
+                value = int.from_bytes(data[pos2:pos2+plen], 'big')
+                yield value >> bits, value & ymask
+            kkk >>= window
+            pos += plen << window
 
 Curve.BASE = Curve(Curve.GX, Curve.GY, False)
 Curve.ZERO = Curve(0, 0, False)
+Curve.ENGINE = select_engine(Curve.P, Curve.A)
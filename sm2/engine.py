@@ -0,0 +1,243 @@
+#-*-coding:utf8;-*-
+''' 椭圆曲线点运算引擎: 标准射影坐标系/Jacobian坐标系 '''
+from .fieldp import FP
+
+
+class ProjectiveEngine:
+    '''
+        标准射影坐标系运算, 适用于任意A
+        点以元组(x, y, z)表示, 仿射坐标为(x/z, y/z), z=0为无穷远点
+        使用gmpy2后端时运算中间值为mpz, 转换为仿射/射影坐标时还原为int
+    '''
+    __slots__ = ['prime', 'coef_a']
+    INF = (1, 1, 0)
+    # 每次点运算的模乘次数(含平方, 不含乘以小常数), 用于运算统计估算模乘总数
+    MUL_COST = {'double': 13, 'add': 15, 'madd': 12}
+
+    def __init__(self, prime, coef_a):
+        self.prime = FP.fast_prime(prime)
+        self.coef_a = coef_a
+
+    def double(self, point):
+        ''' 倍运算 '''
+        c1x, c1y, c1z = point
+        if c1z == 0 or c1y == 0:
+            return self.INF
+        prime = self.prime
+        tt1 = (c1x*c1x*3 + self.coef_a*c1z*c1z) % prime
+        tt2 = (c1y * c1z << 1) % prime
+        tt3 = c1y * c1y % prime
+        tt4 = tt3 * c1x * c1z % prime
+        tt5 = tt2 * tt2 % prime
+        tt6 = (tt1*tt1 - (tt4 << 3)) % prime
+        c3x = tt2 * tt6 % prime
+        c3y = (((tt4 << 2) - tt6)*tt1 - tt5*(tt3 << 1)) % prime
+        c3z = tt2 * tt5 % prime
+        return c3x, c3y, c3z
+
+    def add(self, point1, point2):
+        ''' 加运算 '''
+        # pylint: disable=too-many-locals
+        c1x, c1y, c1z = point1
+        c2x, c2y, c2z = point2
+        if c1z == 0:
+            return point2
+        if c2z == 0:
+            return point1
+        prime = self.prime
+        tt1 = c1x * c2z % prime
+        tt2 = c2x * c1z % prime
+        tt3 = (tt1 - tt2) % prime
+        tt4 = c1y * c2z % prime
+        tt5 = (tt4 - c2y * c1z) % prime
+        if tt3 == 0:
+            return self.double(point1) if tt5 == 0 else self.INF
+        tt2 = (tt1 + tt2) % prime
+        tt6 = c1z * c2z % prime
+        tt7 = tt3 * tt3 % prime
+        tt8 = tt3 * tt7 % prime
+        tt9 = (tt6*tt5*tt5 - tt2*tt7) % prime
+        c3x = tt3 * tt9 % prime
+        c3y = (tt5*(tt7*tt1 - tt9) - tt4*tt8) % prime
+        c3z = tt8 * tt6 % prime
+        return c3x, c3y, c3z
+
+    def madd(self, point, c2x, c2y):
+        ''' 混合加运算: 加上仿射坐标点(c2x, c2y) '''
+        c1x, c1y, c1z = point
+        if c1z == 0:
+            return c2x, c2y, 1
+        prime = self.prime
+        tt2 = c2x * c1z % prime
+        tt3 = (c1x - tt2) % prime
+        tt5 = (c1y - c2y * c1z) % prime
+        if tt3 == 0:
+            return self.double(point) if tt5 == 0 else self.INF
+        tt2 = (c1x + tt2) % prime
+        tt7 = tt3 * tt3 % prime
+        tt8 = tt3 * tt7 % prime
+        tt9 = (c1z*tt5*tt5 - tt2*tt7) % prime
+        c3x = tt3 * tt9 % prime
+        c3y = (tt5*(tt7*c1x - tt9) - c1y*tt8) % prime
+        c3z = tt8 * c1z % prime
+        return c3x, c3y, c3z
+
+    def odd_multiples(self, point, count):
+        ''' 计算P, 3P, 5P, ...共count个奇数倍点(仿射坐标), 用于wNAF '''
+        return self.batch_affine(self.odd_chain(point, count))
+
+    def odd_chain(self, point, count):
+        ''' 计算P, 3P, 5P, ...共count个奇数倍点(运算引擎坐标), 可合并后批量转换 '''
+        double = self.double(point)
+        points = [point]
+        for _ in range(count - 1):
+            points.append(self.add(points[-1], double))
+        return points
+
+    def to_affine(self, point):
+        ''' 转换为仿射坐标(x, y), 无穷远点为(0, 0) '''
+        c1x, c1y, c1z = point
+        if c1z == 0:
+            return 0, 0
+        z_inv = FP.invn(self.prime, c1z)
+        return int(c1x * z_inv % self.prime), int(c1y * z_inv % self.prime)
+
+    def batch_affine(self, points):
+        ''' 批量转换为仿射坐标: 只做一次模逆运算 '''
+        prime = self.prime
+        z_invs = FP.batch_invn(prime, [point[2] for point in points])
+        return [(int(c1x * z_inv % prime), int(c1y * z_inv % prime))
+                for (c1x, c1y, _), z_inv in zip(points, z_invs)]
+
+    def to_projective(self, point):
+        ''' 转换为标准射影坐标(x, y, z) '''
+        c1x, c1y, c1z = point
+        return int(c1x), int(c1y), int(c1z)
+
+    def from_projective(self, point):
+        ''' 从标准射影坐标转换 '''
+        return point
+
+
+class JacobianEngine(ProjectiveEngine):
+    '''
+        Jacobian坐标系运算, 要求A = -3 (mod P)
+        点以元组(x, y, z)表示, 仿射坐标为(x/z^2, y/z^3), z=0为无穷远点
+    '''
+    __slots__ = []
+    MUL_COST = {'double': 8, 'add': 16, 'madd': 11}
+
+    def double(self, point):
+        ''' 倍运算: dbl-2001-b, 利用A=-3减少乘法 '''
+        c1x, c1y, c1z = point
+        if c1z == 0 or c1y == 0:
+            return self.INF
+        prime = self.prime
+        delta = c1z * c1z % prime
+        gamma = c1y * c1y % prime
+        beta = c1x * gamma % prime
+        alpha = 3 * (c1x - delta) * (c1x + delta) % prime
+        c3x = (alpha*alpha - (beta << 3)) % prime
+        c3z = (c1y * c1z << 1) % prime
+        c3y = (alpha*((beta << 2) - c3x) - (gamma*gamma << 3)) % prime
+        return c3x, c3y, c3z
+
+    def add(self, point1, point2):
+        ''' 加运算 '''
+        c1x, c1y, c1z = point1
+        c2x, c2y, c2z = point2
+        if c1z == 0:
+            return point2
+        if c2z == 0:
+            return point1
+        prime = self.prime
+        z1z1 = c1z * c1z % prime
+        z2z2 = c2z * c2z % prime
+        uu1 = c1x * z2z2 % prime
+        ss1 = c1y * c2z * z2z2 % prime
+        hhh = (c2x * z1z1 - uu1) % prime
+        rrr = (c2y * c1z * z1z1 - ss1) % prime
+        if hhh == 0:
+            return self.double(point1) if rrr == 0 else self.INF
+        hh2 = hhh * hhh % prime
+        hh3 = hhh * hh2 % prime
+        vvv = uu1 * hh2 % prime
+        c3x = (rrr*rrr - hh3 - (vvv << 1)) % prime
+        c3y = (rrr*(vvv - c3x) - ss1*hh3) % prime
+        c3z = c1z * c2z * hhh % prime
+        return c3x, c3y, c3z
+
+    def madd(self, point, c2x, c2y):
+        ''' 混合加运算: 加上仿射坐标点(c2x, c2y) '''
+        c1x, c1y, c1z = point
+        if c1z == 0:
+            return c2x, c2y, 1
+        prime = self.prime
+        z1z1 = c1z * c1z % prime
+        hhh = (c2x * z1z1 - c1x) % prime
+        rrr = (c2y * c1z * z1z1 - c1y) % prime
+        if hhh == 0:
+            return self.double(point) if rrr == 0 else self.INF
+        hh2 = hhh * hhh % prime
+        hh3 = hhh * hh2 % prime
+        vvv = c1x * hh2 % prime
+        c3x = (rrr*rrr - hh3 - (vvv << 1)) % prime
+        c3y = (rrr*(vvv - c3x) - c1y*hh3) % prime
+        c3z = c1z * hhh % prime
+        return c3x, c3y, c3z
+
+    def to_affine(self, point):
+        ''' 转换为仿射坐标(x, y), 无穷远点为(0, 0) '''
+        c1x, c1y, c1z = point
+        if c1z == 0:
+            return 0, 0
+        prime = self.prime
+        z_inv = FP.invn(prime, c1z)
+        z_inv2 = z_inv * z_inv % prime
+        return int(c1x * z_inv2 % prime), int(c1y * z_inv2 * z_inv % prime)
+
+    def batch_affine(self, points):
+        ''' 批量转换为仿射坐标: 只做一次模逆运算 '''
+        prime = self.prime
+        z_invs = FP.batch_invn(prime, [point[2] for point in points])
+        result = []
+        for (c1x, c1y, _), z_inv in zip(points, z_invs):
+            z_inv2 = z_inv * z_inv % prime
+            result.append((int(c1x * z_inv2 % prime), int(c1y * z_inv2 * z_inv % prime)))
+        return result
+
+    def to_projective(self, point):
+        ''' 转换为标准射影坐标: (x*z, y, z^3) '''
+        c1x, c1y, c1z = point
+        prime = self.prime
+        return int(c1x * c1z % prime), int(c1y), int(c1z * c1z * c1z % prime)
+
+    def from_projective(self, point):
+        ''' 从标准射影坐标(x, y, z)转换: (x*z, y*z^2, z) '''
+        c1x, c1y, c1z = point
+        prime = self.prime
+        return c1x * c1z % prime, c1y * c1z * c1z % prime, c1z
+
+
+def wnaf(kkk, width):
+    ''' 计算k的宽度为w的NAF表示(低位在前), 非零位为奇数且|d| < 2^(w-1) '''
+    digits = []
+    full = 1 << width
+    half = full >> 1
+    while kkk:
+        digit = 0
+        if kkk & 1:
+            digit = kkk & (full - 1)
+            if digit >= half:
+                digit -= full
+            kkk -= digit
+        digits.append(digit)
+        kkk >>= 1
+    return digits
+
+
+def select_engine(prime, coef_a):
+    ''' 根据曲线参数选择运算引擎: A = -3 时使用Jacobian坐标系 '''
+    if (coef_a + 3) % prime == 0:
+        return JacobianEngine(prime, coef_a)
+    return ProjectiveEngine(prime, coef_a)
@@ -1,11 +1,117 @@
 #-*-coding:utf8;-*-
 ''' 素数域FP上的数学运算 '''
+import os
+import warnings
+from time import perf_counter
+try:
+    # SM2_BACKEND=python时不导入gmpy2, 参见FP.BACKEND
+    if os.environ.get('SM2_BACKEND', 'auto') == 'python':
+        raise ImportError('gmpy2 disabled by SM2_BACKEND')
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+
+class SolinasPrime(int):
+    '''
+        广义梅森素数(Solinas素数) P = 2^n - c, c由少量带符号的2的幂组成
+        x % P 利用 2^n = c (mod P) 移位加减折叠约简, 代替大整数除法
+    '''
+    def __new__(cls, num, terms):
+        obj = super().__new__(cls, num)
+        obj.bits = num.bit_length()
+        obj.mask = (1 << obj.bits) - 1
+        obj.terms = terms
+        return obj
+
+    def __getnewargs__(self):
+        return int(self), self.terms
+
+    def __rmod__(self, value):
+        ''' 折叠约简: x = H*2^n + L = H*c + L (mod P) '''
+        if value < 0:
+            return int.__mod__(value, self)
+        bits, mask = self.bits, self.mask
+        while high := value >> bits:
+            value &= mask
+            for shift, sign in self.terms:
+                if sign > 0:
+                    value += high << shift
+                else:
+                    value -= high << shift
+        while value >= self:
+            value -= self
+        return value
+
 
 class FP:
     ''' 素数域上的数学运算 '''
     __slots__ = []
     POW_2_P_4 = {}  # 2**((P-1)/4)  (mod P)
     FACTOR_P1 = {}  # P-1 = S*2^T
+    PRIMES = {}     # 各素数选定的取模实现
+    # 取模实现: auto(自测选择), mod(CPython的%), solinas(折叠约简)
+    REDUCE = os.environ.get('SM2_REDUCE', 'auto')
+    # 大整数运算后端: auto(安装了gmpy2时使用), gmpy2, python; 导入时确定
+    BACKEND = os.environ.get('SM2_BACKEND', 'auto')
+
+    @staticmethod
+    def solinas_terms(num, maxterms=6):
+        ''' 若P = 2^n - c且c的NAF表示不超过maxterms项, 返回[(shift, sign), ...] '''
+        ccc = (1 << num.bit_length()) - num
+        terms = []
+        shift = 0
+        while ccc:
+            if ccc & 1:
+                sign = 2 - (ccc & 3)
+                terms.append((shift, sign))
+                ccc -= sign
+            ccc >>= 1
+            shift += 1
+        if len(terms) > maxterms or terms[-1][0] >= num.bit_length() - 1:
+            return None
+        return terms[::-1]
+
+    @staticmethod
+    def fast_prime(num):
+        '''
+            为素数选择取模实现: gmpy2后端返回mpz, 折叠约简比CPython的%更快时
+            返回SolinasPrime, 否则返回原值. 曲线公式中的 x % prime 由此自动
+            使用选定的实现
+        '''
+        if num in FP.PRIMES:
+            return FP.PRIMES[num]
+        prime = num
+        terms = FP.solinas_terms(num)
+        if FP.BACKEND == 'gmpy2':
+            prime = gmpy2.mpz(num)
+        elif terms and FP.REDUCE != 'mod':
+            solinas = SolinasPrime(num, terms)
+            if FP.REDUCE == 'solinas':
+                prime = solinas
+            else:
+                time_mod, time_fold = FP.bench_reduce(solinas)
+                if time_fold < time_mod:
+                    prime = solinas
+        FP.PRIMES[num] = prime
+        return prime
+
+    @staticmethod
+    def bench_reduce(prime, rounds=100, bits=None):
+        ''' 测量乘积取模的耗时(秒): 返回(CPython的%, 折叠约简) '''
+        num = int(prime)
+        value = (num - 2) * (num // 3)
+        if bits:
+            value &= (1 << bits) - 1
+        start = perf_counter()
+        for _ in range(rounds):
+            int.__mod__(value, num)
+        time_mod = perf_counter() - start
+        start = perf_counter()
+        for _ in range(rounds):
+            value % prime  # pylint: disable=pointless-statement
+        time_fold = perf_counter() - start
+        return time_mod / rounds, time_fold / rounds
 
     @staticmethod
     def divn(num, aaa, bbb):
@@ -14,7 +120,12 @@ class FP:
 
     @staticmethod
     def invn(num, aaa):
-        ''' 模逆运算 '''
+        ''' 模逆运算: 导入时自测选择invn_pow或invn_euclid '''
+        return FP.invn_euclid(num, aaa)
+
+    @staticmethod
+    def invn_euclid(num, aaa):
+        ''' 模逆运算: 扩展欧几里得算法 '''
         if aaa in {0, 1}:
             return aaa
         xxx, yyy = 1, 0
@@ -25,9 +136,51 @@ class FP:
             aaa, bbb = bbb, aaa - quotient*bbb
         return xxx % num if aaa == 1 else 0
 
+    @staticmethod
+    def invn_pow(num, aaa):
+        ''' 模逆运算: 内置pow(a, -1, n) '''
+        aaa %= num
+        if aaa in {0, 1}:
+            return aaa
+        try:
+            return pow(aaa, -1, num)
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def invn_gmpy(num, aaa):
+        ''' 模逆运算: gmpy2.invert '''
+        try:
+            return int(gmpy2.invert(aaa, num))
+        except ZeroDivisionError:
+            return 0
+
+    @staticmethod
+    def batch_invn(num, values):
+        ''' 批量模逆运算(Montgomery's trick): 只做一次模逆, 0的模逆仍为0 '''
+        prods = []
+        acc = 1
+        for aaa in values:
+            prods.append(acc)
+            if aaa % num:
+                acc = acc * aaa % num
+        inv = FP.invn(num, acc)
+        result = [0] * len(prods)
+        for i in range(len(prods) - 1, -1, -1):
+            aaa = values[i] % num
+            if aaa:
+                result[i] = inv * prods[i] % num
+                inv = inv * aaa % num
+        return result
+
     @staticmethod
     def pown(num, aaa, exp):
-        ''' 模快幂运算 '''
+        ''' 模快幂运算: 导入时自测选择pown_pow或pown_square '''
+        return FP.pown_square(num, aaa, exp)
+
+    @staticmethod
+    def pown_square(num, aaa, exp):
+        ''' 模快幂运算: 平方-乘算法 '''
         if aaa in {0, 1}:
             return aaa
         result = aaa
@@ -38,6 +191,36 @@ class FP:
                 result = result * aaa % num
         return result
 
+    @staticmethod
+    def pown_pow(num, aaa, exp):
+        ''' 模快幂运算: 内置pow(a, e, n) '''
+        if aaa in {0, 1}:
+            return aaa
+        return pow(aaa, exp, num)
+
+    @staticmethod
+    def pown_gmpy(num, aaa, exp):
+        ''' 模快幂运算: gmpy2.powmod '''
+        if aaa in {0, 1}:
+            return aaa
+        return int(gmpy2.powmod(aaa, exp, num))
+
+    @staticmethod
+    def select(candidates, *args, rounds=20):
+        ''' 自测选择最快的实现: 结果与第一个候选不一致的实现不参与选择 '''
+        expect = candidates[0](*args)
+        best, best_time = candidates[0], None
+        for func in candidates:
+            if func(*args) != expect:
+                continue
+            start = perf_counter()
+            for _ in range(rounds):
+                func(*args)
+            elapsed = perf_counter() - start
+            if best_time is None or elapsed < best_time:
+                best, best_time = func, elapsed
+        return best
+
     @staticmethod
     def is_square(num, aaa):
         ''' 判断是否为平方数(模P的二次剩余) '''
@@ -131,3 +314,19 @@ class FP:
             return xxx if xxx & 1 == sign else num - xxx
         # 如果前面已判断, 此语句不会执行
         raise ValueError(f'v={aaa} is not square modulo {num})')
+
+
+if FP.BACKEND == 'gmpy2' and gmpy2 is None:
+    warnings.warn('SM2_BACKEND=gmpy2 but gmpy2 is not installed, using python.')
+FP.BACKEND = 'gmpy2' if gmpy2 is not None and FP.BACKEND != 'python' else 'python'
+
+_P256 = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFF
+if FP.BACKEND == 'gmpy2':
+    # 参数可能为mpz, 内置pow对mpz的负指数支持因版本而异, 不参与自测选择
+    FP.invn = staticmethod(FP.invn_gmpy)
+    FP.pown = staticmethod(FP.pown_gmpy)
+else:
+    FP.invn = staticmethod(FP.select(
+        [FP.invn_euclid, FP.invn_pow], _P256, _P256 // 3))
+    FP.pown = staticmethod(FP.select(
+        [FP.pown_square, FP.pown_pow], _P256, _P256 // 3, _P256 >> 2, rounds=2))
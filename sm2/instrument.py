@@ -0,0 +1,219 @@
+#-*-coding:utf8;-*-
+'''
+    运算统计(可选): 统计每次SM2运算的模逆/点加/倍点等次数及各阶段耗时
+    启用时替换相关方法为计数版本, 停用后恢复原方法, 未启用时没有任何开销
+'''
+import threading
+from time import perf_counter
+from .curve import Curve
+from .fieldp import FP
+from .sm2 import SM2, CurveSM2, ASN1
+
+# 被统计的SM2运算
+OPERATIONS = ('sign', 'verify', 'sign_digest', 'verify_digest', 'encrypt', 'decrypt',
+              'sign_many', 'verify_many', 'verify_multi', 'encrypt_many', 'decrypt_many')
+# 各阶段包含的方法: (类, 方法名)
+PHASES = {
+    'hash': [(SM2, '_get_sign_hash'), (SM2, '_get_user_z')],
+    'kdf': [(SM2, '_kdf')],
+    'asn1': [(SM2, '_decode_signed_asn1'), (SM2, '_decode_ciphertext_asn1'),
+             (SM2, '_decode_ciphertext'), (ASN1, 'encode_sequence')],
+    'ec': [(SM2, 'fmul'), (Curve, 'gmul'), (Curve, 'gmul_add'), (Curve, 'gmul_add_point'),
+           (Curve, 'gmul_many'), (Curve, 'tmul_point'), (Curve, 'wmul'), (Curve, 'mul_many'),
+           (Curve, 'wnaf_point')],
+}
+# 计数的方法, 只计最外层调用(batch_invn内的invn, sqrtp内的pown不再计数);
+# 点运算(double, add, madd)在运算引擎上计数, 模乘次数取自引擎的MUL_COST, 参见Instrument._patch_engine
+COUNTERS = [(FP, 'invn'), (FP, 'batch_invn'), (FP, 'pown'), (FP, 'sqrtp')]
+
+
+class Record:
+    ''' 一次运算的统计: 总耗时, 各阶段耗时, 各运算次数 '''
+    __slots__ = ['operation', 'start', 'phase', 'phases', 'counts', 'counting']
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.start = perf_counter()
+        self.phase = None
+        self.phases = {}
+        self.counts = {}
+        self.counting = False
+
+    def count(self, name):
+        ''' 计数加1 '''
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def to_dict(self, costs):
+        ''' 转换为发送给sink的字典, costs: 运算引擎每次点运算的模乘次数 '''
+        counts = dict(self.counts)
+        counts['field_mul_est'] = sum(counts.get(name, 0) * cost
+                                      for name, cost in costs.items())
+        return {'operation': self.operation, 'time': perf_counter() - self.start,
+                'phases': self.phases, 'counts': counts}
+
+
+class StatsSink:
+    ''' 按运算名称累计统计信息, 可输出Prometheus文本格式 '''
+    __slots__ = ['stats', 'lock']
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        with self.lock:
+            stats = self.stats.setdefault(record['operation'], {
+                'count': 0, 'time': 0.0, 'phases': {}, 'counts': {}})
+            stats['count'] += 1
+            stats['time'] += record['time']
+            for name, value in record['phases'].items():
+                stats['phases'][name] = stats['phases'].get(name, 0.0) + value
+            for name, value in record['counts'].items():
+                stats['counts'][name] = stats['counts'].get(name, 0) + value
+
+    def clear(self):
+        ''' 清空统计信息 '''
+        with self.lock:
+            self.stats.clear()
+
+    def prometheus(self, prefix='sm2'):
+        ''' 输出Prometheus文本格式 '''
+        lines = [f'# TYPE {prefix}_operations_total counter',
+                 f'# TYPE {prefix}_operation_seconds_total counter',
+                 f'# TYPE {prefix}_phase_seconds_total counter',
+                 f'# TYPE {prefix}_ops_total counter']
+        with self.lock:
+            for operation, stats in sorted(self.stats.items()):
+                label = f'operation="{operation}"'
+                lines.append(f'{prefix}_operations_total{{{label}}} {stats["count"]}')
+                lines.append(f'{prefix}_operation_seconds_total{{{label}}} {stats["time"]:.9f}')
+                for name, value in sorted(stats['phases'].items()):
+                    lines.append(f'{prefix}_phase_seconds_total{{{label},phase="{name}"}} '
+                                 f'{value:.9f}')
+                for name, value in sorted(stats['counts'].items()):
+                    lines.append(f'{prefix}_ops_total{{{label},op="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class Instrument:
+    '''
+        运算统计, sink: 接收每次运算统计字典的可调用对象(如StatsSink())
+        字典格式: {'operation': 名称, 'time': 秒, 'phases': {阶段: 秒},
+                   'counts': {方法: 次数, 'field_mul_est': 估算的模乘次数}}
+        同一时间只能启用一个, 可用作上下文管理器
+    '''
+    __slots__ = ['sink', 'local', 'patched', 'costs']
+    ACTIVE = None
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.local = threading.local()
+        self.patched = []
+        self.costs = {}
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def enable(self):
+        ''' 启用统计: 替换被统计的方法 '''
+        if Instrument.ACTIVE is not None:
+            raise RuntimeError('Another instrument is enabled.')
+        Instrument.ACTIVE = self
+        for name in OPERATIONS:
+            self._patch(SM2, name, self._operation(name))
+        for phase, methods in PHASES.items():
+            for cls, name in methods:
+                self._patch(cls, name, self._phase(phase))
+        for cls, name in COUNTERS:
+            self._patch(cls, name, self._counter(name, True))
+        self._patch_engine()
+
+    def disable(self):
+        ''' 停用统计: 恢复原方法 '''
+        if Instrument.ACTIVE is not self:
+            return
+        while self.patched:
+            cls, name, attr = self.patched.pop()
+            setattr(cls, name, attr)
+        Instrument.ACTIVE = None
+
+    def current(self):
+        ''' 当前线程正在统计的运算 '''
+        return getattr(self.local, 'record', None)
+
+    def _patch(self, cls, name, wrap):
+        ''' 替换cls.name, 保持staticmethod/classmethod的类型 '''
+        attr = cls.__dict__[name]
+        if isinstance(attr, (staticmethod, classmethod)):
+            setattr(cls, name, type(attr)(wrap(attr.__func__)))
+        else:
+            setattr(cls, name, wrap(attr))
+        self.patched.append((cls, name, attr))
+
+    def _patch_engine(self):
+        ''' 运算引擎使用__slots__, 替换为计数的子类实例 '''
+        engine = CurveSM2.ENGINE
+        self.costs = type(engine).MUL_COST
+        attrs = {'__slots__': []}
+        for name in ('double', 'add', 'madd'):
+            attrs[name] = self._counter(name)(getattr(type(engine), name))
+        counting = type('Counting' + type(engine).__name__, (type(engine),), attrs)
+        copy = object.__new__(counting)
+        for cls in type(engine).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                setattr(copy, slot, getattr(engine, slot))
+        self.patched.append((CurveSM2, 'ENGINE', engine))
+        CurveSM2.ENGINE = copy
+
+    def _operation(self, operation):
+        def wrap(func):
+            def wrapper(*args, **kwargs):
+                if self.current() is not None:
+                    return func(*args, **kwargs)
+                self.local.record = Record(operation)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record, self.local.record = self.local.record, None
+                    self.sink(record.to_dict(self.costs))
+            return wrapper
+        return wrap
+
+    def _phase(self, phase):
+        def wrap(func):
+            def wrapper(*args, **kwargs):
+                record = self.current()
+                if record is None or record.phase is not None:
+                    return func(*args, **kwargs)
+                record.phase = phase
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record.phases[phase] = record.phases.get(phase, 0.0) + \
+                                           perf_counter() - start
+                    record.phase = None
+            return wrapper
+        return wrap
+
+    def _counter(self, name, outer=False):
+        ''' outer为真时只计最外层的调用, 内部调用的其它计数方法不再计数 '''
+        def wrap(func):
+            def wrapper(*args, **kwargs):
+                record = self.current()
+                if record is None or outer and record.counting:
+                    return func(*args, **kwargs)
+                record.count(name)
+                if not outer:
+                    return func(*args, **kwargs)
+                record.counting = True
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record.counting = False
+            return wrapper
+        return wrap
@@ -0,0 +1,101 @@
+#-*-coding:utf8;-*-
+''' 密钥派生函数(KDF)及异或运算 '''
+import hashlib
+from sm3 import sm3_hash
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 数据长度达到此值且安装了NumPy时, 使用NumPy异或
+XOR_NUMPY_MIN = 1 << 12
+# hashlib(OpenSSL)是否支持SM3: 不支持时增量SM3(SM3Buffer)需缓存全部数据, 流式处理不省内存
+try:
+    hashlib.new('sm3')
+    SM3_INCREMENTAL = True
+except ValueError:
+    SM3_INCREMENTAL = False
+
+
+class SM3Buffer:
+    ''' hashlib不支持SM3时的替代: 缓存全部数据, 取摘要时一次计算(内存与数据等长) '''
+    __slots__ = ['data']
+
+    def __init__(self, data=b''):
+        self.data = bytearray(data)
+
+    def update(self, data):
+        ''' 追加数据 '''
+        self.data.extend(data)
+
+    def copy(self):
+        ''' 复制当前状态 '''
+        return SM3Buffer(self.data)
+
+    def digest(self):
+        ''' 计算摘要 '''
+        return sm3_hash(bytes(self.data))
+
+
+def sm3_new(data=b''):
+    ''' 增量SM3: 优先使用hashlib(OpenSSL)的实现, 否则缓存数据后调用sm3_hash '''
+    hasher = hashlib.new('sm3') if SM3_INCREMENTAL else SM3Buffer()
+    hasher.update(data)
+    return hasher
+
+
+class KeyStream:
+    '''
+        KDF密钥流: 按需逐块生成 SM3(Z || ct), 不预先生成与明文等长的密钥
+        Z的摘要状态只计算一次, 每块复制该状态后追加计数器
+    '''
+    __slots__ = ['prefix', 'counter', 'buffer']
+
+    def __init__(self, z_bits):
+        self.prefix = sm3_new(z_bits)
+        self.counter = 1
+        self.buffer = bytearray()
+
+    def blocks(self, count):
+        ''' 生成后续count块(每块32字节)密钥, 写入预先分配的缓冲区 '''
+        result = bytearray(count << 5)
+        prefix = self.prefix
+        pos = 0
+        for counter in range(self.counter, self.counter + count):
+            hasher = prefix.copy()
+            hasher.update(counter.to_bytes(4, 'big'))
+            result[pos:pos+32] = hasher.digest()
+            pos += 32
+        self.counter += count
+        return result
+
+    def read(self, size):
+        ''' 取出size字节的密钥 '''
+        if not self.buffer:
+            key = self.blocks((size + 31) >> 5)
+        else:
+            key = self.buffer
+            if len(key) < size:
+                key.extend(self.blocks((size - len(key) + 31) >> 5))
+        self.buffer = key[size:]
+        del key[size:]
+        return key
+
+
+def kdf(z_bits, klen):
+    ''' 密钥派生函数: 生成klen字节的密钥 '''
+    return KeyStream(z_bits).read(klen)
+
+
+def bitxor(data1, data2):
+    ''' Xor Byte to Byte: 按较短的数据截断, 整体转为大整数(或NumPy数组)异或 '''
+    length = min(len(data1), len(data2))
+    if length == 0:
+        return b''
+    if numpy is not None and length >= XOR_NUMPY_MIN:
+        return numpy.bitwise_xor(numpy.frombuffer(data1, numpy.uint8, length),
+                                 numpy.frombuffer(data2, numpy.uint8, length)).tobytes()
+    with memoryview(data1) as view1, memoryview(data2) as view2:
+        with view1[:length] as part1, view2[:length] as part2:
+            value = int.from_bytes(part1, 'big') ^ int.from_bytes(part2, 'big')
+    return value.to_bytes(length, 'big')
@@ -0,0 +1,134 @@
+#-*-coding:utf8;-*-
+''' 公钥批量加载: 解析并校验编码后的点, 缓存已校验的编码 '''
+import threading
+from .curve import CurveError
+
+
+class PointArray:
+    ''' 紧凑的点数组: 每个点为 x || y, 无效的点为(0, 0) '''
+    __slots__ = ['data', 'size', 'invalid']
+
+    def __init__(self, size):
+        self.data = bytearray()
+        self.size = size
+        self.invalid = []
+
+    def __len__(self):
+        return len(self.data) // (self.size << 1)
+
+    def __getitem__(self, index):
+        ''' 取出第index个点的(x, y) '''
+        plen = self.size << 1
+        index = range(len(self))[index]
+        pos = index * plen
+        return (int.from_bytes(self.data[pos:pos+self.size], 'big'),
+                int.from_bytes(self.data[pos+self.size:pos+plen], 'big'))
+
+    def tobytes(self):
+        ''' 所有点的字节串 '''
+        return bytes(self.data)
+
+
+class KeyLoader:
+    '''
+        公钥批量加载, 支持未压缩(04/06/07), 压缩(02/03)及无前缀的x || y编码
+        已校验的编码缓存其 x || y(最多maxsize个), 重复加载时不再解析及校验
+    '''
+    __slots__ = ['curve', 'maxsize', 'cache', 'lock', 'hits', 'misses']
+
+    def __init__(self, curve, maxsize=1 << 16):
+        self.curve = curve
+        self.maxsize = maxsize
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self):
+        ''' 统计信息 '''
+        return {'keys': len(self.cache), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        ''' 清空缓存 '''
+        with self.lock:
+            self.cache.clear()
+
+    def point(self, data):
+        ''' 加载一个公钥, 返回曲线对象, 编码无效时抛出ValueError或CurveError '''
+        coords = self.coords(data)
+        size = self.curve.LEN
+        return self.curve(int.from_bytes(coords[:size], 'big'),
+                          int.from_bytes(coords[size:], 'big'), False)
+
+    def load(self, datas, compact=False, errors='raise'):
+        '''
+            批量加载公钥, 按顺序返回曲线对象列表
+            compact为真时返回PointArray, 不创建曲线对象
+            errors='raise'时遇到无效编码抛出异常, errors='skip'时该项为None
+            (compact为真时该项为(0, 0), 序号记录在PointArray.invalid中)
+        '''
+        if errors not in {'raise', 'skip'}:
+            raise ValueError('The errors should be raise or skip.')
+        result = PointArray(self.curve.LEN) if compact else []
+        for index, data in enumerate(datas):
+            try:
+                coords = self.coords(data)
+            except (TypeError, ValueError, CurveError):
+                if errors == 'raise':
+                    raise
+                if compact:
+                    result.data.extend(bytes(self.curve.LEN << 1))
+                    result.invalid.append(index)
+                else:
+                    result.append(None)
+                continue
+            if compact:
+                result.data.extend(coords)
+            else:
+                size = self.curve.LEN
+                result.append(self.curve(int.from_bytes(coords[:size], 'big'),
+                                         int.from_bytes(coords[size:], 'big'), False))
+        return result
+
+    def coords(self, data):
+        ''' 解析并校验一个编码后的点, 返回 x || y 字节串 '''
+        key = bytes(data)
+        coords = self.cache.get(key)
+        if coords is not None:
+            self.hits += 1
+            return coords
+        coords = self._parse(key)
+        with self.lock:
+            self.misses += 1
+            if len(self.cache) >= self.maxsize:
+                # 淘汰最早加入的编码
+                del self.cache[next(iter(self.cache))]
+            self.cache[key] = coords
+        return coords
+
+    def _parse(self, data):
+        curve = self.curve
+        size = curve.LEN
+        if len(data) == size << 1:
+            coords = data
+        elif len(data) == (size << 1) + 1 and data[0] in (4, 6, 7):
+            if data[0] != 4 and data[0] & 1 != data[-1] & 1:
+                # 混合编码(06/07)的前缀须与y的奇偶一致
+                raise ValueError('Invalid bytes: ' + data.hex())
+            coords = data[1:]
+        elif len(data) == size + 1 and data[0] in (2, 3):
+            coord_x = int.from_bytes(data[1:], 'big')
+            if not 0 < coord_x < curve.P:
+                raise CurveError(coord_x, 0)
+            coord_y = curve.calc_y(coord_x, data[0] & 1)
+            if not curve.check(coord_x, coord_y):
+                raise CurveError(coord_x, coord_y)
+            return data[1:] + coord_y.to_bytes(size, 'big')
+        else:
+            raise ValueError('Invalid bytes: ' + data.hex())
+        coord_x = int.from_bytes(coords[:size], 'big')
+        coord_y = int.from_bytes(coords[size:], 'big')
+        if coord_x == 0 and coord_y == 0 or not curve.check(coord_x, coord_y):
+            raise CurveError(coord_x, coord_y)
+        return coords
@@ -0,0 +1,109 @@
+#-*-coding:utf8;-*-
+''' 签名随机数池: 预计算(k, k*G的x坐标), 签名时只需哈希及少量模运算 '''
+import os
+import threading
+import weakref
+from collections import deque
+
+
+class NoncePool:
+    '''
+        签名随机数池, 每项(k, x1)只会被取出一次
+        create: 批量生成函数, create(count)返回[(k, x1), ...]
+        size: 池容量, low: 低水位, 低于此值时补充
+        refill: 'thread'(后台线程补充), 'inline'(取用时同步补充),
+                或可调用对象(低水位时调用refill(pool), 由调用方安排补充)
+    '''
+    __slots__ = ['create', 'size', 'low', 'batch', 'refill', 'entries',
+                 'hits', 'misses', 'pid', 'lock', 'event', 'thread', 'closed', '__weakref__']
+
+    def __init__(self, create, size=256, low=None, batch=32, refill='thread'):
+        self.create = create
+        self.size = size
+        self.low = size >> 2 if low is None else low
+        self.batch = batch
+        self.refill = refill
+        self.entries = deque()
+        self.hits = 0
+        self.misses = 0
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread = None
+        self.closed = False
+        if refill == 'thread':
+            self.event.set()
+            self._start()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def stats(self):
+        ''' 统计信息 '''
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+    def take(self):
+        ''' 取出一项(k, x1), 池为空时返回None '''
+        if self.pid != os.getpid():
+            self._after_fork()
+        try:
+            entry = self.entries.popleft()
+            self.hits += 1
+        except IndexError:
+            entry = None
+            self.misses += 1
+        if len(self.entries) < self.low and not self.closed:
+            self._low_watermark()
+        return entry
+
+    def fill(self, count=None):
+        ''' 补充随机数, 默认补满 '''
+        with self.lock:
+            count = self.size - len(self.entries) if count is None else count
+            while count > 0 and not self.closed:
+                batch = min(count, self.batch)
+                self.entries.extend(self.create(batch))
+                count -= batch
+
+    def close(self):
+        ''' 停止补充并清空 '''
+        self.closed = True
+        self.entries.clear()
+        self.event.set()
+
+    def _low_watermark(self):
+        if self.refill == 'thread':
+            self.event.set()
+        elif self.refill == 'inline':
+            self.fill()
+        elif callable(self.refill):
+            self.refill(self)
+
+    def _start(self):
+        # 线程只持有弱引用, 池被回收时由finalize唤醒线程退出
+        self.thread = threading.Thread(target=NoncePool._run, daemon=True, name='sm2-nonce-pool',
+                                       args=(weakref.ref(self), self.event))
+        self.thread.start()
+        weakref.finalize(self, self.event.set)
+
+    @staticmethod
+    def _run(ref, event):
+        while True:
+            event.wait()
+            event.clear()
+            pool = ref()
+            if pool is None or pool.closed or pool.event is not event:
+                return
+            pool.fill()
+            del pool
+
+    def _after_fork(self):
+        ''' fork后子进程丢弃继承的随机数, 避免与父进程重复使用同一个k '''
+        self.pid = os.getpid()
+        self.entries.clear()
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        if self.refill == 'thread' and not self.closed:
+            self.event.set()
+            self._start()
@@ -0,0 +1,137 @@
+#-*-coding:utf8;-*-
+''' 多进程并行执行SM2运算 '''
+from itertools import islice
+from time import monotonic
+from concurrent.futures import Executor, ProcessPoolExecutor
+from .sm2 import SM2, CurveSM2
+
+_WORKER = None  # 工作进程中的SM2对象
+
+
+def _init_worker(public_key, private_key, use_cache, nonce_pool):
+    ''' 工作进程初始化: 只执行一次, 建立SM2对象及基点缓存 '''
+    global _WORKER  # pylint: disable=global-statement
+    _WORKER = SM2(public_key, private_key, use_cache)
+    if CurveSM2.CACHE is None:
+        CurveSM2.init_cache()
+    if nonce_pool is not None and private_key is not None:
+        _WORKER.enable_nonce_pool(**nonce_pool)
+
+
+def run_batch(sm2, operation, chunk, safe=False):
+    '''
+        批量执行运算, chunk: 参数元组列表, 按顺序返回结果列表
+        safe为真时返回[(异常, 结果), ...], 单项出错不影响其它项
+    '''
+    try:
+        if operation == 'sign':
+            results = sm2.sign_many(args[0] for args in chunk)
+        elif operation == 'verify':
+            results = sm2.verify_many(chunk)
+        elif operation in {'encrypt', 'decrypt'} and \
+                len({args[1] if len(args) > 1 else 'asn1' for args in chunk}) == 1:
+            # 同一模式的加密/解密整批执行, 单项错误由safe参数决定是否抛出
+            func = getattr(sm2, operation + '_many')
+            mode = chunk[0][1] if len(chunk[0]) > 1 else 'asn1'
+            results = func((args[0] for args in chunk), mode, safe)
+            if safe:
+                return results
+        else:
+            func = getattr(sm2, operation)
+            results = [func(*args) for args in chunk]
+        return [(None, result) for result in results] if safe else results
+    except Exception:  # pylint: disable=broad-except
+        if not safe:
+            raise
+    # 批量执行出错时逐项执行, 找出出错的项
+    results = []
+    func = getattr(sm2, operation)
+    for args in chunk:
+        try:
+            results.append((None, func(*args)))
+        except Exception as ex:  # pylint: disable=broad-except
+            results.append((ex, None))
+    return results
+
+
+def _run_batch(operation, chunk, safe):
+    ''' 在工作进程中批量执行 '''
+    return run_batch(_WORKER, operation, chunk, safe)
+
+
+def _run_one(operation, args, kwargs):
+    ''' 在工作进程中执行单个运算 '''
+    return getattr(_WORKER, operation)(*args, **kwargs)
+
+
+class SM2Pool(Executor):
+    '''
+        多进程SM2运算池, 兼容concurrent.futures.Executor
+        工作进程初始化时接收一次密钥并建立缓存, 任务只传递消息数据
+        map/submit的fn可以是运算名称('sign', 'verify', 'encrypt', 'decrypt'),
+        也可以是普通的可调用对象
+    '''
+    OPERATIONS = {'sign', 'verify', 'encrypt', 'decrypt'}
+
+    def __init__(self, public_key, private_key=None, use_cache=None,
+                 max_workers=None, chunksize=64, nonce_pool=None, mp_context=None):
+        if isinstance(public_key, CurveSM2):
+            public_key = bytes(public_key)
+        if private_key is not None:
+            private_key = int(private_key) if isinstance(private_key, int) \
+                          else bytes(private_key)
+        self.chunksize = chunksize
+        self.executor = ProcessPoolExecutor(
+            max_workers, mp_context, initializer=_init_worker,
+            initargs=(public_key, private_key, use_cache, nonce_pool))
+
+    def submit(self, fn, /, *args, **kwargs):
+        ''' 提交单个任务, 返回Future '''
+        if isinstance(fn, str):
+            return self.executor.submit(_run_one, self._check(fn), args, kwargs)
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def submit_batch(self, operation, items, safe=False):
+        '''
+            提交一批任务, items: 参数元组序列, Future的结果为按顺序的结果列表
+            safe为真时结果为[(异常, 结果), ...], 参见run_batch
+        '''
+        return self.executor.submit(_run_batch, self._check(operation),
+                                    list(items), safe)
+
+    def map(self, fn, *iterables, timeout=None, chunksize=None):
+        '''
+            按输入顺序返回结果的迭代器: fn(*args) for args in zip(*iterables)
+            按chunksize分块提交, 分摊进程间通信开销
+        '''
+        chunksize = chunksize or self.chunksize
+        if not isinstance(fn, str):
+            return self.executor.map(fn, *iterables, timeout=timeout,
+                                     chunksize=chunksize)
+        argslist = zip(*iterables)
+        chunks = iter(lambda: list(islice(argslist, chunksize)), [])
+        end = None if timeout is None else monotonic() + timeout
+        futures = [self.submit_batch(fn, chunk) for chunk in chunks]
+        return self._iter_results(futures, end)
+
+    @classmethod
+    def _check(cls, operation):
+        if operation not in cls.OPERATIONS:
+            raise ValueError(f'Unsupported operation: {operation}')
+        return operation
+
+    @staticmethod
+    def _iter_results(futures, end):
+        ''' 按顺序取出各块的结果, end: 整个map的截止时间(与Executor.map一致) '''
+        futures.reverse()
+        try:
+            while futures:
+                future = futures.pop()
+                yield from future.result(None if end is None else end - monotonic())
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        ''' 关闭进程池 '''
+        self.executor.shutdown(wait, cancel_futures=cancel_futures)
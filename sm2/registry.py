@@ -0,0 +1,133 @@
+#-*-coding:utf8;-*-
+''' 进程内公钥状态缓存: LRU, 按使用次数逐级建立预计算表 '''
+import threading
+from collections import OrderedDict
+
+
+class KeyEntry:
+    ''' 公钥状态: SM2对象(含解析后的点, user_z, 奇数倍点及预计算表), 使用次数 '''
+    __slots__ = ['sm2', 'uses', 'window', 'nbytes']
+
+    def __init__(self, sm2, nbytes):
+        self.sm2 = sm2
+        self.uses = 0
+        self.window = 0
+        self.nbytes = nbytes
+
+
+class KeyRegistry:
+    '''
+        进程内公钥状态的LRU缓存, 以编码后的公钥为键
+        create: 由公钥创建SM2对象的函数
+        levels: 升级规则[(使用次数, 窗口宽度), ...], 使用次数达到时建立该窗口宽度的表
+        memory: 所有公钥状态占用内存的上限(字节), 超出时淘汰最久未使用的公钥
+    '''
+    __slots__ = ['create', 'levels', 'memory', 'maxkeys', 'entries', 'lock',
+                 'total', 'hits', 'misses', 'evictions', 'promotions']
+    ENTRY_BYTES = 1024  # 每个公钥除预计算表外的内存估计值
+
+    def __init__(self, create, levels=((16, 4), (256, 8)), memory=64 << 20, maxkeys=4096):
+        self.create = create
+        self.levels = sorted(levels)
+        self.memory = memory
+        self.maxkeys = maxkeys
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.promotions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def stats(self):
+        ''' 统计信息 '''
+        return {'keys': len(self.entries), 'memory': self.total, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'promotions': self.promotions}
+
+    def get(self, public_key):
+        ''' 取得公钥对应的SM2对象, 计入一次使用, 达到升级次数时建立预计算表 '''
+        key = bytes(public_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            entry = self._add(key, public_key)
+
+        entry.uses += 1
+        window = self._promote_window(entry)
+        if window:
+            self._promote(key, entry, window)
+        return entry.sm2
+
+    def clear(self):
+        ''' 清空缓存 '''
+        with self.lock:
+            self.entries.clear()
+            self.total = 0
+
+    def _add(self, key, public_key):
+        sm2 = self.create(public_key)
+        # pylint: disable=protected-access
+        if sm2.user_z is None:
+            sm2._get_user_z()
+        sm2._get_odds()
+        with self.lock:
+            self.misses += 1
+            if (entry := self.entries.get(key)) is None:
+                entry = KeyEntry(sm2, self.ENTRY_BYTES)
+                self.entries[key] = entry
+                self.total += entry.nbytes
+                self._evict()
+        return entry
+
+    def _promote_window(self, entry):
+        ''' 需要升级时返回新的窗口宽度, 并先行记录, 避免多个线程重复建表 '''
+        window = 0
+        for uses, level in self.levels:
+            if entry.uses >= uses and level > entry.window:
+                window = level
+        if not window:
+            return 0
+        with self.lock:
+            if window <= entry.window or self.table_bytes(entry.sm2, window) > self.memory:
+                return 0
+            entry.window = window
+        return window
+
+    def _promote(self, key, entry, window):
+        sm2 = entry.sm2
+        cache = sm2.public_key.create_cache(sm2.public_key, window)
+        with self.lock:
+            sm2.cache = cache
+            self.promotions += 1
+            nbytes = self.ENTRY_BYTES + cache.nbytes
+            if key in self.entries:
+                self.total += nbytes - entry.nbytes
+                self._evict(key)
+            entry.nbytes = nbytes
+
+    def _evict(self, keep=None):
+        ''' 淘汰最久未使用的公钥直到满足内存及数量上限 '''
+        while len(self.entries) > 1 and \
+                (self.total > self.memory or len(self.entries) > self.maxkeys):
+            key, entry = next(iter(self.entries.items()))
+            if key == keep:
+                self.entries.move_to_end(key)
+                key, entry = next(iter(self.entries.items()))
+            del self.entries[key]
+            self.total -= entry.nbytes
+            self.evictions += 1
+
+    @staticmethod
+    def table_bytes(sm2, window):
+        ''' 计算指定窗口宽度的预计算表占用的字节数 '''
+        point = sm2.public_key
+        rows = (point.N.bit_length() + window - 1) // window
+        return (rows << window) * (point.LEN << 1)
@@ -0,0 +1,197 @@
+#-*-coding:utf8;-*-
+''' 进程间共享的预计算表: 内存映射文件或共享内存 '''
+import os
+import time
+import struct
+import hashlib
+from multiprocessing import shared_memory
+from .curve import CacheError
+
+
+class SharedTables:
+    '''
+        进程间共享的预计算表, 按公钥指纹命名, N个进程使用M个公钥只占M份内存
+        path: 目录, 表保存为内存映射文件; 为None时使用共享内存(shared_memory)
+        window: 表的窗口宽度
+        timeout: 等待其它进程生成共享内存表的最长时间(秒), 超时后重新生成
+    '''
+    __slots__ = ['path', 'window', 'timeout']
+    TABLES = {}     # 本进程已连接的表
+    SEGMENTS = {}   # 本进程已连接的共享内存, 保持引用以免被释放
+    # 共享内存段头: 标识, 格式版本, 状态, 生成表的进程pid, 生成时间(ns)
+    SEGMENT = struct.Struct('>4sBBxxIQ')
+    SEGMENT_MAGIC = b'SM2S'
+    SEGMENT_VERSION = 1
+    STATE_OFFSET = 5
+    BUILDING, READY, FAILED = 0, 1, 2
+    HEADER_WAIT = 1.0  # 新建的段写入段头的最长时间(秒), 超过视为无效
+
+    def __init__(self, path=None, window=8, timeout=30):
+        self.path = path
+        self.window = window
+        self.timeout = timeout
+
+    def fingerprint(self, point):
+        ''' 公钥指纹: 曲线参数, 公钥及窗口宽度的SHA-256 '''
+        digest = point.cache_digest(point) + self.window.to_bytes(1, 'big')
+        return hashlib.sha256(digest).hexdigest()[:32]
+
+    def get(self, point):
+        ''' 取得点的预计算表: 已存在时直接连接, 否则生成并共享 '''
+        name = self.fingerprint(point)
+        if name not in SharedTables.TABLES:
+            SharedTables.TABLES[name] = self._get_file(point, name) \
+                if self.path else self._get_shm(point, name)
+        return SharedTables.TABLES[name]
+
+    def base(self, curve):
+        ''' 取得曲线的基点表: 窗口宽度与init_cache一致, 为curve.CACHE_WINDOW '''
+        tables = self if self.window == curve.CACHE_WINDOW else \
+                 SharedTables(self.path, curve.CACHE_WINDOW, self.timeout)
+        return tables.get(curve.BASE)
+
+    def unlink(self, point):
+        ''' 删除点的共享表(已连接的进程仍可继续使用) '''
+        name = self.fingerprint(point)
+        SharedTables.TABLES.pop(name, None)
+        if self.path:
+            try:
+                os.unlink(os.path.join(self.path, name + '.tbl'))
+            except FileNotFoundError:
+                pass
+            return
+        shm = SharedTables.SEGMENTS.get(name) or self._open_shm(name)
+        if shm is not None:
+            self._unlink(shm)
+
+    def _get_file(self, point, name):
+        ''' 内存映射文件: 多个进程映射同一文件, 共用页缓存 '''
+        cls = point.__class__
+        path = os.path.join(self.path, name + '.tbl')
+        if os.path.exists(path):
+            try:
+                return cls.load_cache(path, point)
+            except (OSError, CacheError):
+                pass
+        os.makedirs(self.path, exist_ok=True)
+        cls.save_cache(path, cls.create_cache(point, self.window), point)
+        return cls.load_cache(path, point)
+
+    def _get_shm(self, point, name):
+        '''
+            共享内存: 段头记录格式版本, 状态及生成进程, 第一个进程生成表后置为就绪,
+            其它进程等待就绪; 段无效, 生成进程已退出或等待超时时删除并重新生成
+        '''
+        cls = point.__class__
+        rows = (cls.N.bit_length() + self.window - 1) // self.window
+        size = self.SEGMENT.size + cls.CACHE_HEADER.size + \
+               (rows << self.window) * (cls.LEN << 1)
+        for _ in range(2):
+            try:
+                shm = self._create_shm(name, size)
+            except FileExistsError:
+                shm = self._open_shm(name)
+                if shm is None:
+                    continue
+                table = self._wait_shm(shm, point, size)
+            else:
+                table = self._build_shm(shm, point, size)
+            if table is not None:
+                # 表直接引用共享内存的buf, 需在进程内一直保持共享内存对象
+                SharedTables.SEGMENTS[name] = shm
+                return table
+            self._unlink(shm)
+            shm.close()
+        return cls.create_cache(point, self.window)
+
+    def _build_shm(self, shm, point, size):
+        ''' 生成表写入新建的共享内存: 先写段头(生成中)及内容, 最后置为就绪 '''
+        cls = point.__class__
+        hlen = self.SEGMENT.size
+        shm.buf[:hlen] = self.SEGMENT.pack(self.SEGMENT_MAGIC, self.SEGMENT_VERSION,
+                                           self.BUILDING, os.getpid(), time.time_ns())
+        try:
+            table = cls.create_cache(point, self.window)
+            start = hlen + cls.CACHE_HEADER.size
+            shm.buf[start:size] = table.data
+            shm.buf[hlen:start] = cls.cache_header(table, point)
+            shm.buf[self.STATE_OFFSET] = self.READY
+            return cls.parse_cache(shm.buf, point, size, hlen)
+        except BaseException:
+            # 生成失败: 置为失败并删除段, 等待中的进程不必等到超时
+            shm.buf[self.STATE_OFFSET] = self.FAILED
+            self._unlink(shm)
+            shm.close()
+            raise
+
+    def _wait_shm(self, shm, point, size):
+        ''' 等待其它进程生成的表就绪, 段无效, 生成进程已退出或超时时返回None '''
+        cls = point.__class__
+        hlen = self.SEGMENT.size
+        start = time.monotonic()
+        while True:
+            magic, version, state, pid, _ = self.SEGMENT.unpack(shm.buf[:hlen])
+            elapsed = time.monotonic() - start
+            if magic == self.SEGMENT_MAGIC:
+                if version != self.SEGMENT_VERSION:
+                    return None
+                if state == self.READY:
+                    try:
+                        return cls.parse_cache(shm.buf, point, size, hlen)
+                    except CacheError:
+                        return None
+                if state == self.FAILED or not self._alive(pid):
+                    return None
+            elif magic != bytes(len(magic)) or elapsed > self.HEADER_WAIT:
+                # 新建的段在写入段头前全为0, 其它内容为旧格式或已损坏
+                return None
+            if elapsed > self.timeout:
+                return None
+            time.sleep(0.01)
+
+    @staticmethod
+    def _alive(pid):
+        ''' 生成表的进程是否仍在运行 '''
+        if os.name != 'posix':
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+
+    @staticmethod
+    def _create_shm(name, size):
+        return SharedTables._untrack(shared_memory.SharedMemory('sm2_' + name, True, size))
+
+    @staticmethod
+    def _open_shm(name):
+        try:
+            return SharedTables._untrack(shared_memory.SharedMemory('sm2_' + name))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _unlink(shm):
+        ''' 删除共享内存: 创建/连接时已从resource_tracker注销, 先交还再删除 '''
+        # pylint: disable=protected-access,import-outside-toplevel
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            # 已被其它进程删除
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+    @staticmethod
+    def _untrack(shm):
+        ''' 共享表在创建进程退出后仍需保留, 不交给resource_tracker自动删除 '''
+        # pylint: disable=protected-access,import-outside-toplevel
+        from multiprocessing import resource_tracker
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except (AttributeError, KeyError, ValueError):
+            pass
+        return shm
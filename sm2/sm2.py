@@ -1,8 +1,14 @@
 #-*-coding:utf8;-*-
 ''' 素数域上的椭圆曲线(SM2) '''
 from sm3 import sm3_hash
-from .curve import Curve
+from .curve import Curve, CurveError
+from .engine import select_engine, wnaf
 from .fieldp import FP
+from .kdf import bitxor, kdf, sm3_new
+from .nonce import NoncePool
+from .registry import KeyRegistry
+from .keys import KeyLoader
+from .vcache import VerifyCache
 
 
 class CurveSM2(Curve):
@@ -15,11 +21,11 @@ class CurveSM2(Curve):
     GX = 0x32C4AE2C1F1981195F9904466A39C9948FE30BBFF2660BE1715A4589334C74C7
     GY = 0xBC3736A2F4F6779C59BDCEE36B692153D0A9877CC62A474002DF32E52139F0A0
     LEN = (P.bit_length() + 7) >> 3
-    CACHE = []
+    CACHE = None
 
 CurveSM2.ZERO = CurveSM2(0, 0, False)
 CurveSM2.BASE = CurveSM2(CurveSM2.GX, CurveSM2.GY, False)
-CurveSM2.CACHE = CurveSM2.create_cache(CurveSM2.BASE)
+CurveSM2.ENGINE = select_engine(CurveSM2.P, CurveSM2.A)
 
 
 class SM2PrivateKey(int):
@@ -36,7 +42,7 @@ class SM2Error(Exception):
     __slots__ = ['msg']
 
     def __init__(self, msg):
-        super().__init__()
+        super().__init__(msg)
         self.msg = msg
 
     def __str__(self):
@@ -49,8 +55,10 @@ class SM2:
         解密/签名使用Private Key
         加密/验签使用Public Key
     '''
-    __slots__ = ['public_key', 'private_key', 'cache', 'user_z']
+    __slots__ = ['public_key', 'private_key', 'cache', 'user_z', 'odds', 'inv_d1', 'nonce_pool']
     USER_ID = b'1234567812345678'
+    BATCH_TABLE = (16, 4)  # 批量加密达到此数量时临时建立此窗口宽度的公钥表
+    VERIFY_CACHE = None  # 验签结果缓存(VerifyCache), 参见enable_verify_cache
 
     @staticmethod
     def create_private_key():
@@ -59,25 +67,53 @@ class SM2:
 
     @staticmethod
     def create_public_key(valuex, valuey=0):
-        ''' Create Public Key '''
-        return CurveSM2.from_bytes(valuex) \
+        ''' Create Public Key: 无穷远点不是有效的公钥, 抛出CurveError '''
+        point = CurveSM2.from_bytes(valuex) \
             if isinstance(valuex, (bytes, bytearray)) \
             else CurveSM2(valuex, valuey)
+        if point.coord_x == 0 and point.coord_y == 0:
+            raise CurveError(0, 0)
+        return point
 
 
-    def __init__(self, public_key, private_key=None, use_cache=None):
+    @staticmethod
+    def load_public_keys(datas, compact=False, errors='raise'):
+        '''
+            批量加载编码后的公钥并校验, 已校验的编码缓存在SM2.KEYS中
+            compact为真时返回PointArray(x || y紧凑数组), 否则返回CurveSM2对象列表
+            errors='skip'时无效的公钥为None(compact时为(0, 0)), 不抛出异常
+        '''
+        return SM2.KEYS.load(datas, compact, errors)
+
+
+    def __init__(self, public_key, private_key=None, use_cache=None, window=8):
         self.public_key = public_key
         if isinstance(public_key, (bytes, bytearray)):
-            self.public_key = CurveSM2.from_bytes(public_key)
-        elif not isinstance(public_key, CurveSM2):
+            self.public_key = SM2.KEYS.point(public_key)
+        elif not isinstance(public_key, CurveSM2) or public_key.coord_z == 0 or \
+                public_key.coord_x == 0 and public_key.coord_y == 0:
             raise SM2Error('Invalid public key.')
 
         self.user_z = None
-        self.cache = use_cache and not private_key and \
-                     CurveSM2.create_cache(self.public_key)
-
+        self.odds = None
+        if hasattr(use_cache, 'fingerprint'):
+            # 公钥表及基点表都使用进程间共享的表(SharedTables, 按接口判断以免导入shared_memory)
+            if CurveSM2.CACHE is None:
+                CurveSM2.CACHE = use_cache.base(CurveSM2)
+            self.cache = not private_key and use_cache.get(self.public_key)
+        else:
+            # 公钥表的窗口宽度: 缓存大量公钥时可用较小的窗口节省内存
+            self.cache = use_cache and not private_key and \
+                         CurveSM2.create_cache(self.public_key, window)
+
+        self.inv_d1 = None
+        self.nonce_pool = None
         self.private_key = private_key
         if private_key is None:
+            if use_cache is None and isinstance(public_key, (bytes, bytearray)):
+                # 编码后的公钥共用进程内公钥缓存(SM2.REGISTRY)中的Z值, 奇数倍点及公钥表
+                shared = SM2.REGISTRY.get(self.public_key)
+                self.user_z, self.odds, self.cache = shared.user_z, shared.odds, shared.cache
             return
 
         if isinstance(private_key, (bytes, bytearray)):
@@ -86,45 +122,203 @@ class SM2:
             raise SM2Error('Invalid private key.')
         if CurveSM2.gmul(self.private_key) != self.public_key:
             raise SM2Error('Public key not matched the private key.')
+        # 签名时使用的 (1 + d)^-1, 同一私钥只需计算一次
+        self.inv_d1 = FP.invn(CurveSM2.N, self.private_key + 1)
 
 
     def fmul(self, kkk, affine=True):
         ''' 公钥倍乘运算, 使用缓存加速 '''
         if not self.cache:
             return self.public_key * kkk
-        result = CurveSM2.ZERO.copy()
-        for i in range(32):
-            result.fast_add(self.cache[i][kkk & 0xFF])
-            kkk >>= 8
-        return result.to_affine() if affine else result
+        return CurveSM2.tmul(self.cache, kkk, affine)
 
 
     def verify(self, sign, data):
         ''' 验签函数, sign: 签名r||s, data: 待验签的消息(bytes) '''
+        return self.verify_digest(sign, self._get_sign_hash(data))
+
+
+    def verify_digest(self, sign, eee):
+        '''
+            验签函数, sign: 签名r||s, eee: 已计算的摘要 e = SM3(Z || M)(bytes或整数)
+            摘要可在其它线程/进程或流式处理中计算, 参见signer()/verifier()
+            启用SM2.VERIFY_CACHE时, 已验签成功的输入直接返回True
+        '''
+        eee = (eee if isinstance(eee, int) else bytes2int(eee)) % CurveSM2.N
+        cache = SM2.VERIFY_CACHE
+        key = cache is not None and VerifyCache.key(self.public_key, sign, eee)
+        if key and cache.get(key):
+            return True
         rrr, sss = SM2._decode_signed_asn1(sign)
         ttt = (rrr + sss) % CurveSM2.N
         if rrr == 0 or sss == 0 or ttt == 0 or rrr >= CurveSM2.N or sss >= CurveSM2.N:
             return False
+        result = self._verify_e(rrr, sss, ttt, eee)
+        if result and key:
+            cache.add(key)
+        return result
+
+
+    @staticmethod
+    def enable_verify_cache(maxsize=65536, ttl=None):
+        ''' 启用验签结果缓存(进程内所有SM2对象共用), maxsize为0时停用 '''
+        SM2.VERIFY_CACHE = VerifyCache(maxsize, ttl) if maxsize else None
+        return SM2.VERIFY_CACHE
+
+
+    def _verify_e(self, rrr, sss, ttt, eee):
+        point = CurveSM2.gmul_add_point(sss, ttt, self.public_key, self.cache, self._get_odds())
+        return point[2] != 0 and (eee + CurveSM2.ENGINE.to_affine(point)[0]) % CurveSM2.N == rrr
+
+
+    def _get_odds(self):
+        ''' 无公钥表时验签使用的公钥奇数倍点, 同一对象只计算一次 '''
+        if self.odds is None and not self.cache:
+            self.odds = self.public_key.odd_multiples()
+        return self.odds
+
+
+    def verify_many(self, items):
+        ''' 批量验签函数, items: (签名, 消息)序列, 返回各项的验签结果列表 '''
+        return SM2.verify_multi((self, sign, data) for sign, data in items)
 
-        eee = bytes2int(self._get_sign_hash(data))
-        point = self.fmul(ttt, False).fast_add(CurveSM2.gmul(sss, False)).to_affine()
-        return (eee + point.coord_x) % CurveSM2.N == rrr
+
+    @staticmethod
+    def verify_multi(items):
+        '''
+            多公钥批量验签, items: (公钥, 签名, 消息)序列, 返回各项的验签结果列表
+            公钥可以是SM2对象, CurveSM2对象或编码后的字节串
+            同一公钥共用Z值及奇数倍点, 所有结果点共用一次模逆运算转为仿射坐标
+        '''
+        signers = {}
+        results = []
+        jobs = []
+        cache = SM2.VERIFY_CACHE
+        for public_key, sign, data in items:
+            results.append(False)
+            try:
+                rrr, sss = SM2._decode_signed_asn1(sign)
+            except (SM2Error, ASN1Error, IndexError, TypeError):
+                continue
+            ttt = (rrr + sss) % CurveSM2.N
+            if rrr == 0 or sss == 0 or ttt == 0 or rrr >= CurveSM2.N or sss >= CurveSM2.N:
+                continue
+            signer = SM2._batch_signer(signers, public_key)
+            if signer is None:
+                continue
+            sm2, odds = signer
+            try:
+                digest = sm2._get_sign_hash(data)  # pylint: disable=protected-access
+            except (TypeError, ValueError):
+                continue
+            eee = bytes2int(digest) % CurveSM2.N
+            key = cache is not None and VerifyCache.key(sm2.public_key, sign, eee)
+            if key and cache.get(key):
+                results[-1] = True
+                continue
+            point = CurveSM2.gmul_add_point(sss, ttt, sm2.public_key, sm2.cache, odds)
+            jobs.append((len(results) - 1, eee, rrr, point, key))
+
+        points = CurveSM2.ENGINE.batch_affine([job[3] for job in jobs])
+        for (index, eee, rrr, point, key), (coord_x, _) in zip(jobs, points):
+            results[index] = point[2] != 0 and (eee + coord_x) % CurveSM2.N == rrr
+            if results[index] and key:
+                cache.add(key)
+        return results
+
+
+    @staticmethod
+    def _batch_signer(signers, public_key):
+        '''
+            批量验签时按公钥取出(SM2对象, 奇数倍点), 公钥无效时返回None
+            非SM2对象的公钥从进程内公钥缓存(SM2.REGISTRY)取得, 每项计入一次使用
+        '''
+        try:
+            key = id(public_key) if isinstance(public_key, SM2) else bytes(public_key)
+        except (TypeError, ValueError):
+            return None
+        if key in signers:
+            if signers[key] is not None and not isinstance(public_key, SM2):
+                SM2.REGISTRY.get(public_key)
+            return signers[key]
+        try:
+            sm2 = public_key if isinstance(public_key, SM2) else SM2.REGISTRY.get(
+                public_key if isinstance(public_key, CurveSM2) else SM2.KEYS.point(public_key))
+        except (SM2Error, CurveError, TypeError, ValueError):
+            signers[key] = None
+            return None
+        signers[key] = sm2, sm2._get_odds()  # pylint: disable=protected-access
+        return signers[key]
 
 
     def sign(self, data):
         ''' 签名函数, data: 待签名的消息(bytes) '''
         if self.private_key is None:
             raise SM2Error('No private key specified.')
+        return self.sign_digest(self._get_sign_hash(data))
+
 
-        eee = bytes2int(self._get_sign_hash(data))
-        sss = 0
-        while sss == 0:
+    def sign_digest(self, eee):
+        '''
+            签名函数, eee: 已计算的摘要 e = SM3(Z || M)(bytes或整数)
+            摘要可在其它线程/进程或流式处理中计算, 参见signer()/verifier()
+        '''
+        if self.private_key is None:
+            raise SM2Error('No private key specified.')
+        eee = eee if isinstance(eee, int) else bytes2int(eee)
+        signed = None
+        if self.nonce_pool is not None and (entry := self.nonce_pool.take()):
+            signed = self._sign_k(eee, *entry)
+        while signed is None:
             kkk = CurveSM2.random()
-            point = CurveSM2.gmul(kkk)
-            rrr = (eee + point.coord_x) % CurveSM2.N
-            if rrr and rrr + kkk != CurveSM2.N:
-                sss = FP.divn(CurveSM2.N, kkk - rrr*self.private_key, self.private_key + 1)
+            signed = self._sign_k(eee, kkk, CurveSM2.gmul(kkk).coord_x)
+        return signed
+
+
+    def enable_nonce_pool(self, pool=None, **kwargs):
+        '''
+            启用签名随机数池, 预先计算(k, k*G的x坐标), 签名时直接取用
+            pool: 已有的NoncePool(可在多个SM2对象间共用), 或按kwargs新建
+        '''
+        self.nonce_pool = pool if pool is not None else NoncePool(SM2.create_nonces, **kwargs)
+        return self.nonce_pool
+
+
+    @staticmethod
+    def create_nonces(count):
+        ''' 批量生成签名随机数(k, k*G的x坐标) '''
+        kkks = [CurveSM2.random() for _ in range(count)]
+        return [(kkk, point.coord_x) for kkk, point in zip(kkks, CurveSM2.gmul_many(kkks))]
 
+
+    def sign_many(self, datas):
+        '''
+            批量签名函数, datas: 待签名的消息序列, 按顺序返回签名
+            所有k*G共用一次模逆运算转为仿射坐标
+        '''
+        if self.private_key is None:
+            raise SM2Error('No private key specified.')
+
+        eees = [bytes2int(self._get_sign_hash(data)) for data in datas]
+        kkks = [CurveSM2.random() for _ in eees]
+        result = []
+        for eee, kkk, point in zip(eees, kkks, CurveSM2.gmul_many(kkks)):
+            signed = self._sign_k(eee, kkk, point.coord_x)
+            while signed is None:
+                kkk = CurveSM2.random()
+                signed = self._sign_k(eee, kkk, CurveSM2.gmul(kkk).coord_x)
+            result.append(signed)
+        return result
+
+
+    def _sign_k(self, eee, kkk, coord_x):
+        ''' 使用随机数k及k*G的x坐标签名, 返回None表示需要更换k '''
+        rrr = (eee + coord_x) % CurveSM2.N
+        if rrr == 0 or rrr + kkk == CurveSM2.N:
+            return None
+        sss = (kkk - rrr*self.private_key) * self.inv_d1 % CurveSM2.N
+        if sss == 0:
+            return None
         r_bytes = ASN1.encode_int(rrr)
         s_bytes = ASN1.encode_int(sss)
         return ASN1.encode_sequence(r_bytes, s_bytes)
@@ -143,6 +337,138 @@ class SM2:
         point1 = CurveSM2.gmul(kkk)
         # 生成椭圆曲线上的点C2 = k * PK
         point2 = self.fmul(kkk)
+        return SM2._encrypt_with(point1, point2, plaintext, mode)
+
+
+    def encrypt_many(self, plaintexts, mode='asn1', safe=True):
+        '''
+            批量加密函数, plaintexts: 明文序列, 按顺序返回[(异常, 密文), ...]
+            所有C1 = k * G及C2 = k * PK共用一次模逆运算转为仿射坐标
+            单项出错不影响其它项; safe为假时返回密文列表, 遇到出错的项抛出异常
+        '''
+        if mode not in {'c1c2c3', 'c1c3c2', 'c1c2', 'asn1'}:
+            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
+        plaintexts = list(plaintexts)
+        kkks = [CurveSM2.random() for _ in plaintexts]
+        gcache = CurveSM2.CACHE or CurveSM2.init_cache()
+        points = [CurveSM2.tmul_point(gcache, kkk) for kkk in kkks]
+        # 没有公钥表时, 批量较大则临时建一个小窗口的表, 建表开销低于逐个wNAF倍乘
+        cache = self.cache or len(kkks) >= self.BATCH_TABLE[0] and \
+                CurveSM2.create_cache(self.public_key, self.BATCH_TABLE[1])
+        if cache:
+            points.extend(CurveSM2.tmul_point(cache, kkk) for kkk in kkks)
+        else:
+            odds = self.public_key.odd_multiples()
+            width = len(odds).bit_length() + 1
+            points.extend(CurveSM2.wnaf_point(wnaf(kkk, width), odds) for kkk in kkks)
+        points = [CurveSM2(c1x, c1y, False)
+                  for c1x, c1y in CurveSM2.ENGINE.batch_affine(points)]
+        count = len(plaintexts)
+        results = []
+        for plaintext, point1, point2 in zip(plaintexts, points, points[count:]):
+            try:
+                if plaintext == b'':
+                    raise SM2Error('Plaintext is empty.')
+                result = None, SM2._encrypt_with(point1, point2, plaintext, mode)
+            except (SM2Error, ASN1Error, CurveError, ValueError, IndexError, TypeError) as ex:
+                if not safe:
+                    raise
+                result = ex, None
+            results.append(result if safe else result[1])
+        return results
+
+
+    def decrypt(self, data, mode='asn1'):
+        ''' 解密函数, data: 密文(bytes, bytearray, memoryview或mmap), 不复制密文 '''
+        if mode not in {'c1c2c3', 'c1c3c2', 'c1c2', 'asn1'}:
+            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
+        if self.private_key is None:
+            raise SM2Error('No private key specified.')
+        point1, ciphertext, hashvalue = SM2._decode_ciphertext_asn1(data) \
+                if mode == 'asn1' else SM2._decode_ciphertext(data, mode)
+
+        # 根据私钥生成点C2, 此C2等于加密时的C2
+        # 私钥: SK, 公钥: PK = SK * G
+        # 加密时: C1 = k * G,  C2 = k * PK = k * (SK * G) = k * SK * G
+        # 解密时: C2' = SK * C1 = SK * (k * G) = SK * k * G = C2
+        point2 = point1 * self.private_key
+        return SM2._decrypt_with(point2, ciphertext, hashvalue)
+
+
+    def decrypt_many(self, datas, mode='asn1', safe=True):
+        '''
+            批量解密函数, datas: 密文序列, 按顺序返回[(异常, 明文), ...]
+            各C1的奇数倍点及所有C2 = SK * C1各共用一次模逆运算
+            单项出错(如校验失败)不影响其它项; safe为假时返回明文列表, 遇到出错的项抛出异常
+        '''
+        if mode not in {'c1c2c3', 'c1c3c2', 'c1c2', 'asn1'}:
+            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
+        if self.private_key is None:
+            raise SM2Error('No private key specified.')
+        results = []
+        decoded = []
+        for data in datas:
+            try:
+                point1, ciphertext, hashvalue = SM2._decode_ciphertext_asn1(data) \
+                        if mode == 'asn1' else SM2._decode_ciphertext(data, mode)
+            except (SM2Error, ASN1Error, CurveError, ValueError, IndexError, TypeError) as ex:
+                if not safe:
+                    raise
+                results.append((ex, None))
+                continue
+            results.append(None)
+            decoded.append((len(results) - 1, point1, ciphertext, hashvalue))
+
+        points = CurveSM2.mul_many([item[1] for item in decoded], self.private_key)
+        for (index, _, ciphertext, hashvalue), point2 in zip(decoded, points):
+            try:
+                results[index] = None, SM2._decrypt_with(point2, ciphertext, hashvalue)
+            except SM2Error as ex:
+                if not safe:
+                    raise
+                results[index] = ex, None
+        return results if safe else [result for _, result in results]
+
+
+    def signer(self):
+        ''' 流式签名, 返回SM2Signer: update(消息块), sign() '''
+        from .stream import SM2Signer  # pylint: disable=import-outside-toplevel
+        return SM2Signer(self)
+
+
+    def verifier(self, sign):
+        ''' 流式验签, 返回SM2Verifier: update(消息块), verify() '''
+        from .stream import SM2Verifier  # pylint: disable=import-outside-toplevel
+        return SM2Verifier(self, sign)
+
+
+    def encryptor(self, mode='asn1'):
+        ''' 流式加密, 返回SM2Encryptor: update(明文块), finalize() '''
+        from .stream import SM2Encryptor  # pylint: disable=import-outside-toplevel
+        return SM2Encryptor(self, mode)
+
+
+    def decryptor(self, mode='asn1', verify_first=False):
+        ''' 流式解密, 返回SM2Decryptor: update(密文块), finalize() '''
+        from .stream import SM2Decryptor  # pylint: disable=import-outside-toplevel
+        return SM2Decryptor(self, mode, verify_first)
+
+
+    def encrypt_file(self, src, dst, mode='asn1', chunk_size=1 << 20):
+        ''' 文件加密, 源文件使用mmap映射, 分块处理 '''
+        from .stream import encrypt_file  # pylint: disable=import-outside-toplevel
+        encrypt_file(self, src, dst, mode, chunk_size)
+
+
+    def decrypt_file(self, src, dst, mode='asn1', chunk_size=1 << 20):
+        ''' 文件解密, 源文件使用mmap映射, 分块处理, 校验失败时删除目标文件 '''
+        from .stream import decrypt_file  # pylint: disable=import-outside-toplevel
+        decrypt_file(self, src, dst, mode, chunk_size)
+
+
+    @staticmethod
+    def _encrypt_with(point1, point2, plaintext, mode):
+        ''' 已知C1 = k * G及C2 = k * PK, 加密并按mode编码 '''
         # 根据点C2生成加密密钥
         x2_bytes = point2.bytes_x
         y2_bytes = point2.bytes_y
@@ -153,8 +479,10 @@ class SM2:
         if mode == 'c1c2':
             return bytes(point1) + ciphertext
 
-        hashsrc = x2_bytes + plaintext + y2_bytes
-        hashvalue = sm3_hash(hashsrc)
+        hasher = sm3_new(x2_bytes)
+        hasher.update(plaintext)
+        hasher.update(y2_bytes)
+        hashvalue = hasher.digest()
         if mode == 'c1c3c2':
             return bytes(point1) + hashvalue + ciphertext
         if mode == 'c1c2c3':
@@ -167,21 +495,9 @@ class SM2:
             ASN1.encode_octet(ciphertext)
         )
 
-
-    def decrypt(self, data, mode='asn1'):
-        ''' 解密函数, data: 密文(bytes) '''
-        if mode not in {'c1c2c3', 'c1c3c2', 'c1c2', 'asn1'}:
-            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
-        if self.private_key is None:
-            raise SM2Error('No private key specified.')
-        point1, ciphertext, hashvalue = SM2._decode_ciphertext_asn1(data) \
-                if mode == 'asn1' else SM2._decode_ciphertext(data, mode)
-
-        # 根据私钥生成点C2, 此C2等于加密时的C2
-        # 私钥: SK, 公钥: PK = SK * G
-        # 加密时: C1 = k * G,  C2 = k * PK = k * (SK * G) = k * SK * G
-        # 解密时: C2' = SK * C1 = SK * (k * G) = SK * k * G = C2
-        point2 = point1 * self.private_key
+    @staticmethod
+    def _decrypt_with(point2, ciphertext, hashvalue):
+        ''' 已知C2 = SK * C1, 解密并校验摘要 '''
         # 根据点C2生成解密密钥
         x2_bytes = point2.bytes_x
         y2_bytes = point2.bytes_y
@@ -192,12 +508,13 @@ class SM2:
             return plaintext
 
         # 根据点C2及明文件计算校验摘要
-        hashsrc = x2_bytes + plaintext + y2_bytes
-        if sm3_hash(hashsrc) != hashvalue:
+        hasher = sm3_new(x2_bytes)
+        hasher.update(plaintext)
+        hasher.update(y2_bytes)
+        if hasher.digest() != hashvalue:
             raise SM2Error('Hash check failed.')
         return plaintext
 
-
     def _get_user_z(self):
         entl = len(self.USER_ID) << 3
         z_bits = bytearray(int2bytes(entl, 2))
@@ -212,59 +529,72 @@ class SM2:
         return self.user_z
 
     def _get_sign_hash(self, data):
-        user_z = self.user_z or self._get_user_z()
-        return sm3_hash(user_z + data)
+        return self.hasher(data).digest()
+
+    def hasher(self, data=b''):
+        ''' 返回已输入Z的增量SM3对象, 继续输入消息M即得到签名摘要 e = SM3(Z || M) '''
+        hasher = sm3_new(self.user_z or self._get_user_z())
+        hasher.update(data)
+        return hasher
 
     @staticmethod
     def _kdf(z_bits, klen):
-        result = bytearray()
-        rcnt = (klen + 31) >> 5
-        for i in range(1, rcnt + 1):
-            data = z_bits + int2bytes(i, 4)
-            result.extend(sm3_hash(data))
-        return result[:klen]
+        return kdf(z_bits, klen)
 
     @staticmethod
     def _decode_signed_asn1(sign):
-        ''' 按ASN.1 BER规则解码签名 '''
-        sign, rest = ASN1.decode_sequence(sign)
-        if sign == b'' or rest != b'':
+        ''' 按ASN.1 BER(ASN1.STRICT为真时DER)规则解码签名 '''
+        strict = ASN1.STRICT
+        start, end = ASN1.read_tlv(sign, 0, 0x30, strict)
+        if start == end or end != len(sign):
+            raise SM2Error('Invalid signed bytes.')
+        rrr, pos = ASN1.read_int(sign, start, strict)
+        sss, pos = ASN1.read_int(sign, pos, strict)
+        if strict and pos != end:
             raise SM2Error('Invalid signed bytes.')
-        rrr, rest = ASN1.decode_int(sign)
-        sss, rest = ASN1.decode_int(rest)
         return rrr, sss
 
     @staticmethod
     def _decode_ciphertext_asn1(data):
-        ''' 按ASN.2 BER规则解码密文 '''
-        data, rest = ASN1.decode_sequence(data)
-        if data == b'' or rest != b'':
+        '''
+            按ASN.1 BER(ASN1.STRICT为真时DER)规则解码密文
+            按偏移量解码, 密文C2以memoryview返回, 不复制(可以是bytearray, mmap)
+        '''
+        strict = ASN1.STRICT
+        start, end = ASN1.read_tlv(data, 0, 0x30, strict)
+        if start == end or end != len(data):
             raise SM2Error('Invalid cipher text.')
-        c1x, rest = ASN1.decode_int(data)
-        c1y, rest = ASN1.decode_int(rest)
-        hashvalue, rest = ASN1.decode_octet(rest)
-        ciphertext, rest = ASN1.decode_octet(rest)
-        if rest != b'':
+        c1x, pos = ASN1.read_int(data, start, strict)
+        c1y, pos = ASN1.read_int(data, pos, strict)
+        hstart, pos = ASN1.read_tlv(data, pos, 4, strict)
+        cstart, cend = ASN1.read_tlv(data, pos, 4, strict)
+        if cend != end:
             raise SM2Error('Invalid cipher text.')
-        return CurveSM2(c1x, c1y), ciphertext, hashvalue
+        view = memoryview(data)
+        return decode_c1(c1x, c1y), view[cstart:cend], bytes(view[hstart:pos])
 
     @staticmethod
     def _decode_ciphertext(data, mode):
-        ''' 按C1C2C3或C1C3C2或C1C2顺序解码密文 '''
+        ''' 按C1C2C3或C1C3C2或C1C2顺序解码密文, 密文C2以memoryview返回, 不复制 '''
         dlen = len(data)
         if dlen < 66 or data[0] != 4:
             raise SM2Error('Invalid cipher text.')
+        view = memoryview(data)
         # 取出数据生成点C1
-        c1x = bytes2int(data[1:33])
-        c1y = bytes2int(data[33:65])
-        point = CurveSM2(c1x, c1y)
+        c1x = bytes2int(view[1:33])
+        c1y = bytes2int(view[33:65])
+        point = decode_c1(c1x, c1y)
         # 取出密文及校验哈希
         if mode == 'c1c3c2':
-            return point, data[97:], data[65:97]
+            return point, view[97:], bytes(view[65:97])
         if mode == 'c1c2c3':
-            return point, data[65:dlen-32], data[dlen-32:]
+            return point, view[65:dlen-32], bytes(view[dlen-32:])
         # mode == 'c1c2'
-        return point, data[65:], None
+        return point, view[65:], None
+
+
+SM2.KEYS = KeyLoader(CurveSM2)
+SM2.REGISTRY = KeyRegistry(SM2)
 
 
 class ASN1Error(Exception):
@@ -272,7 +602,7 @@ class ASN1Error(Exception):
     __slots__ = ['msg']
 
     def __init__(self, msg):
-        super().__init__()
+        super().__init__(msg)
         self.msg = msg
 
     def __str__(self):
@@ -280,8 +610,13 @@ class ASN1Error(Exception):
 
 
 class ASN1:
-    ''' ASN.1编解码 '''
+    '''
+        ASN.1编解码
+        decode_*返回内容及剩余部分的切片; read_*按偏移量解码, 不复制数据,
+        可直接用于bytes, bytearray, memoryview及mmap, strict为真时按DER规则校验
+    '''
     __slots__ = []
+    STRICT = False  # 签名及密文解码是否按DER规则严格校验
 
     @staticmethod
     def encode_int(value):
@@ -313,7 +648,7 @@ class ASN1:
     def decode_int(data):
         ''' 按ASN.1 BER规则解码整数 '''
         if data[0] != 2:
-            raise ASN1Error('Integer tag error: ' + data[0])
+            raise ASN1Error(f'Integer tag error: {data[0]:#04x}')
         asn_len, data = ASN1.decode_length(data[1:])
         if len(data) < asn_len:
             raise ASN1Error('Integer length error.')
@@ -323,7 +658,7 @@ class ASN1:
     def decode_octet(data):
         ''' 按ASN.1 BER规则解码Octet '''
         if data[0] != 4:
-            raise ASN1Error('Octet tag error: ' + data[0])
+            raise ASN1Error(f'Octet tag error: {data[0]:#04x}')
         asn_len, data = ASN1.decode_length(data[1:])
         if len(data) < asn_len:
             raise ASN1Error('Octet length error.')
@@ -333,7 +668,7 @@ class ASN1:
     def decode_sequence(data):
         ''' 按ASN.1 BER规则解码序列 '''
         if data[0] != 0x30:
-            raise ASN1Error('Sequence tag error: ' + data[0])
+            raise ASN1Error(f'Sequence tag error: {data[0]:#04x}')
         asn_len, data = ASN1.decode_length(data[1:])
         if len(data) < asn_len:
             raise ASN1Error('Sequence length error.')
@@ -351,6 +686,43 @@ class ASN1:
         length = bytes2int(data[1:pos])
         return length, data[pos:]
 
+    @staticmethod
+    def read_length(data, pos, strict=False):
+        ''' 解码pos处的长度字段, 返回(长度, 内容的起始位置) '''
+        if pos >= len(data):
+            raise ASN1Error('Length field missing.')
+        length = data[pos]
+        if length < 128:
+            return length, pos + 1
+        if length == 128:
+            raise ASN1Error('Indefinite length not supported.')
+        end = pos + length - 127
+        if end > len(data):
+            raise ASN1Error('Length field error.')
+        length = bytes2int(data[pos+1:end])
+        if strict and (length < 128 or data[pos+1] == 0):
+            raise ASN1Error('Length not in DER form.')
+        return length, end
+
+    @staticmethod
+    def read_tlv(data, pos, tag, strict=False):
+        ''' 解码pos处标签为tag的字段, 返回内容的(起始位置, 结束位置) '''
+        if pos >= len(data) or data[pos] != tag:
+            raise ASN1Error(f'Tag error at {pos}: expect {tag:#04x}.')
+        length, start = ASN1.read_length(data, pos + 1, strict)
+        if start + length > len(data):
+            raise ASN1Error(f'Length error at {pos}.')
+        return start, start + length
+
+    @staticmethod
+    def read_int(data, pos, strict=False):
+        ''' 解码pos处的整数, 返回(整数, 下一字段的位置), DER要求非负且无多余的前导0 '''
+        start, end = ASN1.read_tlv(data, pos, 2, strict)
+        if strict and (start == end or data[start] >= 0x80 or
+                       end - start > 1 and data[start] == 0 and data[start+1] < 0x80):
+            raise ASN1Error(f'Integer not in DER form at {pos}.')
+        return bytes2int(data[start:end]), end
+
 
 def int2bytes(value, length):
     ''' Convert Integer to Bytes '''
@@ -360,6 +732,8 @@ def bytes2int(bytestr):
     ''' Convert Bytes to Integer '''
     return int.from_bytes(bytestr, 'big')
 
-def bitxor(data1, data2):
-    ''' Xor Byte to Byte '''
-    return bytes(a ^ b for a, b in zip(data1, data2))
+def decode_c1(c1x, c1y):
+    ''' 密文中的点C1: 无穷远点抛出SM2Error, 不在曲线上抛出CurveError '''
+    if c1x == 0 and c1y == 0:
+        raise SM2Error('Invalid cipher text.')
+    return CurveSM2(c1x, c1y)
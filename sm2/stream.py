@@ -0,0 +1,374 @@
+#-*-coding:utf8;-*-
+''' 流式加密/解密: 分块处理大数据, 密钥流及C3摘要增量计算 '''
+import os
+import mmap
+from .sm2 import SM2Error, CurveSM2, ASN1, bytes2int, decode_c1
+from .kdf import KeyStream, bitxor, sm3_new, SM3_INCREMENTAL
+
+MODES = {'c1c2c3', 'c1c3c2', 'c1c2', 'asn1'}
+
+
+class SM2Encryptor:
+    '''
+        流式加密: update(明文块)返回密文块, finalize()返回剩余的密文
+        c1c2, c1c2c3模式直接输出; c1c3c2, asn1模式C3在C2之前, 需缓存全部密文
+        到finalize时输出(holds_ciphertext为真). 明文可重复读取时, 可先用prehash()
+        把全部明文过一遍算出C3, 第二遍update时即可直接输出(参见encrypt_file)
+        hashlib不支持SM3时, C3的计算需缓存全部明文(incremental为假)
+    '''
+    __slots__ = ['mode', 'point1', 'y2_bytes', 'keys', 'hasher', 'buffer',
+                 'length', 'prehashed', 'head', 'done']
+
+    def __init__(self, sm2, mode='asn1'):
+        if mode not in MODES:
+            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
+        kkk = CurveSM2.random()
+        self.mode = mode
+        self.point1 = CurveSM2.gmul(kkk)
+        point2 = sm2.fmul(kkk)
+        self.y2_bytes = point2.bytes_y
+        self.keys = KeyStream(point2.bytes_x + point2.bytes_y)
+        self.hasher = sm3_new(point2.bytes_x) if mode != 'c1c2' else None
+        self.buffer = bytearray()
+        self.length = 0
+        self.prehashed = None
+        self.head = bytes(self.point1) if mode in {'c1c2', 'c1c2c3'} else None
+        self.done = False
+
+    @property
+    def holds_ciphertext(self):
+        ''' 是否需要缓存全部密文到finalize时输出 '''
+        return self.mode in {'c1c3c2', 'asn1'} and self.prehashed is None
+
+    @property
+    def incremental(self):
+        ''' C3是否增量计算(不缓存明文) '''
+        return self.hasher is None or SM3_INCREMENTAL
+
+    @property
+    def buffered(self):
+        ''' 是否在内存中保留全部数据(密文或计算C3的明文)到finalize '''
+        return self.holds_ciphertext or not self.incremental
+
+    def prehash(self, chunk):
+        ''' 两遍加密的第一遍: 先按明文计算C3, 须在update之前完成 '''
+        if self.length:
+            raise SM2Error('Prehash should be done before update.')
+        self.prehashed = (self.prehashed or 0) + len(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+
+    def update(self, chunk):
+        ''' 加密一块明文, 返回可以输出的密文 '''
+        if self.done:
+            raise SM2Error('Encryptor already finalized.')
+        if not chunk:
+            return b''
+        self.length += len(chunk)
+        if self.prehashed is None:
+            if self.hasher is not None:
+                self.hasher.update(chunk)
+        elif self.length > self.prehashed:
+            raise SM2Error('Plaintext longer than prehashed.')
+        ciphertext = bitxor(chunk, self.keys.read(len(chunk)))
+        if self.holds_ciphertext:
+            self.buffer.extend(ciphertext)
+            return b''
+        if self.head is None:
+            self.head = self._header(self._hashvalue())
+        head, self.head = self.head, b''
+        return head + ciphertext
+
+    def finalize(self):
+        ''' 结束加密, 返回剩余的密文 '''
+        if self.done:
+            raise SM2Error('Encryptor already finalized.')
+        if self.length == 0:
+            raise SM2Error('Plaintext is empty.')
+        if self.prehashed is not None and self.length != self.prehashed:
+            raise SM2Error('Plaintext not matched the prehashed.')
+        self.done = True
+        if self.mode == 'c1c2':
+            return b''
+        if self.mode == 'c1c2c3':
+            return self._hashvalue()
+        if not self.holds_ciphertext:
+            return b''
+        ciphertext, self.buffer = bytes(self.buffer), None
+        return self._header(self._hashvalue()) + ciphertext
+
+    def _hashvalue(self):
+        self.hasher.update(self.y2_bytes)
+        return self.hasher.digest()
+
+    def _header(self, hashvalue):
+        ''' C2之前的部分: C1 || C3, 或ASN.1编码中密文之前的部分 '''
+        if self.mode == 'c1c3c2':
+            return bytes(self.point1) + hashvalue
+        length = self.prehashed or self.length
+        head = ASN1.encode_int(self.point1.coord_x) + ASN1.encode_int(self.point1.coord_y) \
+             + ASN1.encode_octet(hashvalue) + b'\x04' + ASN1.encode_length(length)
+        return b'\x30' + ASN1.encode_length(len(head) + length) + head
+
+
+class SM2Decryptor:
+    '''
+        流式解密: update(密文块)返回明文块, finalize()校验C3
+        update返回的明文在finalize成功前未经校验; verify_first为真时缓存
+        全部明文, 校验通过后由finalize返回
+        hashlib不支持SM3时, C3的校验需缓存全部明文(incremental为假)
+    '''
+    __slots__ = ['sm2', 'mode', 'verify_first', 'head', 'keys', 'hasher', 'y2_bytes',
+                 'hashvalue', 'remain', 'tail', 'buffer', 'done']
+    HEAD_SIZE = 128  # ASN.1编码中密文之前部分的最大长度
+
+    def __init__(self, sm2, mode='asn1', verify_first=False):
+        if mode not in MODES:
+            raise SM2Error('The mode shoud be c1c2c3 or c1c3c2 or asn1.')
+        if sm2.private_key is None:
+            raise SM2Error('No private key specified.')
+        self.sm2 = sm2
+        self.mode = mode
+        self.verify_first = verify_first
+        self.head = bytearray()
+        self.keys = None
+        self.hasher = None
+        self.y2_bytes = None
+        self.hashvalue = None
+        self.remain = None
+        self.tail = bytearray()
+        self.buffer = bytearray()
+        self.done = False
+
+    @property
+    def incremental(self):
+        ''' C3是否增量校验(不缓存明文) '''
+        return self.mode == 'c1c2' or SM3_INCREMENTAL
+
+    @property
+    def buffered(self):
+        ''' 是否在内存中保留全部明文到finalize '''
+        return self.verify_first or not self.incremental
+
+    def update(self, chunk):
+        ''' 解密一块密文, 返回可以输出的明文 '''
+        if self.done:
+            raise SM2Error('Decryptor already finalized.')
+        return self._update(chunk)
+
+    def _update(self, chunk):
+        if self.keys is None:
+            self.head.extend(chunk)
+            if not self._parse_head(False):
+                return b''
+            chunk, self.head = bytes(self.head), None
+        if self.mode == 'c1c2c3':
+            # 最后32字节是C3, 始终保留到finalize
+            self.tail.extend(chunk)
+            chunk = bytes(self.tail[:-32])
+            del self.tail[:-32]
+        elif self.remain is not None:
+            self.remain -= len(chunk)
+            if self.remain < 0:
+                raise SM2Error('Invalid cipher text.')
+        if not chunk:
+            return b''
+        plaintext = bitxor(chunk, self.keys.read(len(chunk)))
+        if self.hasher is not None:
+            self.hasher.update(plaintext)
+        if self.verify_first:
+            self.buffer.extend(plaintext)
+            return b''
+        return plaintext
+
+    def finalize(self):
+        ''' 结束解密并校验C3, 校验失败抛出SM2Error '''
+        if self.done:
+            raise SM2Error('Decryptor already finalized.')
+        self.done = True
+        if self.keys is None:
+            if not self._parse_head(True):
+                raise SM2Error('Invalid cipher text.')
+            chunk, self.head = bytes(self.head), None
+            rest = self._update(chunk)
+        else:
+            rest = b''
+        if self.mode == 'c1c2c3':
+            if len(self.tail) != 32:
+                raise SM2Error('Invalid cipher text.')
+            self.hashvalue = bytes(self.tail)
+        elif self.remain:
+            raise SM2Error('Invalid cipher text.')
+        if self.hasher is not None:
+            self.hasher.update(self.y2_bytes)
+            if self.hasher.digest() != self.hashvalue:
+                raise SM2Error('Hash check failed.')
+        if self.verify_first:
+            rest, self.buffer = bytes(self.buffer), None
+        return rest
+
+    def _parse_head(self, final):
+        ''' 解析C2之前的部分, 数据不足时返回False, 成功后self.head只剩密文 '''
+        head = self.head
+        if self.mode != 'asn1':
+            size = 97 if self.mode == 'c1c3c2' else 65
+            if len(head) < size:
+                return False
+            if head[0] != 4:
+                raise SM2Error('Invalid cipher text.')
+            point1 = decode_c1(bytes2int(head[1:33]), bytes2int(head[33:65]))
+            self.hashvalue = bytes(head[65:size]) if self.mode == 'c1c3c2' else None
+        else:
+            if len(head) < self.HEAD_SIZE and not final:
+                return False
+            point1, size = self._parse_asn1(bytes(head[:self.HEAD_SIZE]))
+        del self.head[:size]
+        point2 = point1 * self.sm2.private_key
+        self.keys = KeyStream(point2.bytes_x + point2.bytes_y)
+        if self.mode != 'c1c2':
+            self.hasher = sm3_new(point2.bytes_x)
+            self.y2_bytes = point2.bytes_y
+        return True
+
+    def _parse_asn1(self, head):
+        ''' 解析ASN.1编码的 SEQUENCE{x, y, C3, C2} 中C2之前的部分 '''
+        strict = ASN1.STRICT
+        if not head or head[0] != 0x30:
+            raise SM2Error('Invalid cipher text.')
+        seqlen, start = ASN1.read_length(head, 1, strict)
+        c1x, pos = ASN1.read_int(head, start, strict)
+        c1y, pos = ASN1.read_int(head, pos, strict)
+        hstart, pos = ASN1.read_tlv(head, pos, 4, strict)
+        self.hashvalue = head[hstart:pos]
+        if pos >= len(head) or head[pos] != 4:
+            raise SM2Error('Invalid cipher text.')
+        self.remain, size = ASN1.read_length(head, pos + 1, strict)
+        if seqlen != size - start + self.remain:
+            raise SM2Error('Invalid cipher text.')
+        return decode_c1(c1x, c1y), size
+
+
+class SM2Signer:
+    '''
+        流式签名: update(消息块)增量计算 e = SM3(Z || M), sign()返回签名
+        hashlib不支持SM3时需缓存全部消息(incremental为假)
+    '''
+    __slots__ = ['sm2', 'hasher']
+
+    def __init__(self, sm2):
+        if sm2.private_key is None:
+            raise SM2Error('No private key specified.')
+        self.sm2 = sm2
+        self.hasher = sm2.hasher()
+
+    @property
+    def incremental(self):
+        ''' 摘要是否增量计算(不缓存消息) '''
+        return SM3_INCREMENTAL
+
+    @property
+    def buffered(self):
+        ''' 是否在内存中保留全部消息 '''
+        return not SM3_INCREMENTAL
+
+    def update(self, chunk):
+        ''' 输入一块消息 '''
+        self.hasher.update(chunk)
+        return self
+
+    def digest(self):
+        ''' 当前的签名摘要e(bytes) '''
+        return self.hasher.copy().digest()
+
+    def sign(self):
+        ''' 对已输入的消息签名 '''
+        return self.sm2.sign_digest(self.digest())
+
+
+class SM2Verifier:
+    '''
+        流式验签: update(消息块)增量计算 e = SM3(Z || M), verify()返回验签结果
+        hashlib不支持SM3时需缓存全部消息(incremental为假)
+    '''
+    __slots__ = ['sm2', 'sign', 'hasher']
+
+    def __init__(self, sm2, sign):
+        self.sm2 = sm2
+        self.sign = sign
+        self.hasher = sm2.hasher()
+
+    @property
+    def incremental(self):
+        ''' 摘要是否增量计算(不缓存消息) '''
+        return SM3_INCREMENTAL
+
+    @property
+    def buffered(self):
+        ''' 是否在内存中保留全部消息 '''
+        return not SM3_INCREMENTAL
+
+    def update(self, chunk):
+        ''' 输入一块消息 '''
+        self.hasher.update(chunk)
+        return self
+
+    def digest(self):
+        ''' 当前的签名摘要e(bytes) '''
+        return self.hasher.copy().digest()
+
+    def verify(self):
+        ''' 验证已输入的消息 '''
+        return self.sm2.verify_digest(self.sign, self.digest())
+
+
+def _chunks(data, chunk_size):
+    ''' 按chunk_size切分数据, 每次只复制一块 '''
+    for pos in range(0, len(data), chunk_size):
+        yield data[pos:pos+chunk_size]
+
+
+def _map_file(file):
+    ''' 只读映射整个文件, 空文件返回b'' '''
+    if os.fstat(file.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def encrypt_file(sm2, src, dst, mode='asn1', chunk_size=1 << 20):
+    '''
+        文件加密: 源文件使用mmap映射, 分块加密写入目标文件
+        c1c3c2, asn1模式先读一遍源文件计算C3, 不缓存密文
+        (hashlib不支持SM3时计算C3仍需缓存全部明文, 参见SM2Encryptor.incremental)
+    '''
+    encryptor = SM2Encryptor(sm2, mode)
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        data = _map_file(fin)
+        try:
+            if encryptor.holds_ciphertext:
+                for chunk in _chunks(data, chunk_size):
+                    encryptor.prehash(chunk)
+            for chunk in _chunks(data, chunk_size):
+                fout.write(encryptor.update(chunk))
+            fout.write(encryptor.finalize())
+        finally:
+            if data:
+                data.close()
+
+
+def decrypt_file(sm2, src, dst, mode='asn1', chunk_size=1 << 20):
+    ''' 文件解密: 源文件使用mmap映射, 分块解密写入目标文件, 校验失败时删除目标文件 '''
+    decryptor = SM2Decryptor(sm2, mode)
+    try:
+        with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+            data = _map_file(fin)
+            try:
+                for chunk in _chunks(data, chunk_size):
+                    fout.write(decryptor.update(chunk))
+                fout.write(decryptor.finalize())
+            finally:
+                if data:
+                    data.close()
+    except Exception:
+        if os.path.exists(dst):
+            os.unlink(dst)
+        raise
@@ -0,0 +1,65 @@
+#-*-coding:utf8;-*-
+''' 验签结果缓存: 只缓存验签成功的(公钥, 签名, 摘要), LRU及过期时间 '''
+import threading
+from time import monotonic
+from collections import OrderedDict
+
+
+class VerifyCache:
+    '''
+        验签成功结果的LRU缓存, 线程安全, 键为(公钥编码, 签名, e = SM3(Z || M))
+        maxsize: 最多缓存的结果数; ttl: 结果的有效期(秒), None为不过期
+        只缓存成功的结果, 伪造的输入不会使缓存返回错误的结果
+    '''
+    __slots__ = ['maxsize', 'ttl', 'entries', 'lock', 'hits', 'misses']
+
+    def __init__(self, maxsize=65536, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def stats(self):
+        ''' 统计信息 '''
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+    @staticmethod
+    def key(public_key, sign, eee):
+        '''
+            生成缓存键, eee: 摘要模曲线的阶N后的整数(0 <= e < N)
+            验签只用到e mod N, 字节串摘要与同值的整数(或加上N的倍数)对应同一个键
+        '''
+        return bytes(public_key), bytes(sign), eee.to_bytes(32, 'big')
+
+    def get(self, key):
+        ''' 查询键是否已验签成功 '''
+        with self.lock:
+            expire = self.entries.get(key)
+            if expire is not None and (expire == 0 or expire > monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expire is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        ''' 记录验签成功的键 '''
+        expire = monotonic() + self.ttl if self.ttl else 0
+        with self.lock:
+            self.entries[key] = expire
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        ''' 清空缓存 '''
+        with self.lock:
+            self.entries.clear()
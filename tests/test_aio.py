@@ -0,0 +1,122 @@
+''' asyncio前端 '''
+import asyncio
+
+import pytest
+
+from sm2 import SM2, SM2Error, ASN1Error
+import sm2.aio
+from sm2.aio import AsyncSM2
+
+
+@pytest.fixture(name='sm2_s', scope='module')
+def fixture_sm2_s():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.fixture(name='batches')
+def fixture_batches(monkeypatch):
+    ''' 记录每批提交的(运算, 项数) '''
+    batches = []
+    run_batch = sm2.aio.run_batch
+
+    def record(target, operation, chunk, safe):
+        batches.append((operation, len(chunk)))
+        return run_batch(target, operation, chunk, safe)
+
+    monkeypatch.setattr(sm2.aio, 'run_batch', record)
+    return batches
+
+
+def test_roundtrip(sm2_s, batches):
+    async def main():
+        asy = AsyncSM2(sm2_s)
+        signs = await asyncio.gather(*(asy.sign(bytes([idx])) for idx in range(5)))
+        verified = await asyncio.gather(*(asy.verify(sign, bytes([idx]))
+                                          for idx, sign in enumerate(signs)))
+        ciphertext = await asy.encrypt(b'async', 'c1c3c2')
+        return verified, await asy.decrypt(ciphertext, 'c1c3c2')
+
+    verified, plaintext = asyncio.run(main())
+    assert verified == [True] * 5 and plaintext == b'async'
+    # 同一事件循环周期内的请求合并为一批
+    assert batches == [('sign', 5), ('verify', 5), ('encrypt', 1), ('decrypt', 1)]
+
+
+def test_flush_size(sm2_s, batches):
+    async def main():
+        asy = AsyncSM2(sm2_s, batch_size=4, batch_delay=30)
+        return await asyncio.wait_for(
+            asyncio.gather(*(asy.sign(b'size') for _ in range(8))), 10)
+
+    assert len(asyncio.run(main())) == 8
+    assert batches == [('sign', 4), ('sign', 4)]
+
+
+def test_flush_delay(sm2_s, batches):
+    async def main():
+        asy = AsyncSM2(sm2_s, batch_size=100, batch_delay=0.05)
+        first = [asyncio.ensure_future(asy.sign(b'delay')) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.append(asyncio.ensure_future(asy.sign(b'delay')))
+        await asyncio.gather(*first)
+        await asy.sign(b'later')
+
+    asyncio.run(main())
+    assert batches == [('sign', 4), ('sign', 1)]
+
+
+@pytest.mark.parametrize('overflow', ['wait', 'reject'])
+def test_overflow(sm2_s, batches, overflow):
+    async def main():
+        asy = AsyncSM2(sm2_s, max_pending=2, batch_delay=0.05, overflow=overflow)
+        tasks = [asyncio.ensure_future(asy.sign(b'overflow')) for _ in range(2)]
+        await asyncio.sleep(0)
+        third = asyncio.ensure_future(asy.sign(b'third'))
+        results = await asyncio.gather(*tasks, third, return_exceptions=True)
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, bytes) for result in results[:2])
+    if overflow == 'wait':
+        assert sm2_s.verify(results[2], b'third')
+        assert batches == [('sign', 2), ('sign', 1)]
+    else:
+        assert isinstance(results[2], SM2Error)
+        assert batches == [('sign', 2)]
+
+
+def test_overflow_value():
+    with pytest.raises(ValueError):
+        AsyncSM2(None, overflow='drop')
+
+
+def test_exceptions(sm2_s, batches):
+    async def main():
+        asy = AsyncSM2(sm2_s)
+        good = sm2_s.encrypt(b'good')
+        return await asyncio.gather(asy.decrypt(good), asy.decrypt(b'bad'),
+                                    asy.decrypt(good), asy.encrypt(b'', 'c1c2'),
+                                    asy.encrypt(b'ok', 'c1c2'), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert results[0] == results[2] == b'good'
+    assert isinstance(results[1], ASN1Error)
+    assert isinstance(results[3], SM2Error)
+    assert sm2_s.decrypt(results[4], 'c1c2') == b'ok'
+    assert batches == [('decrypt', 3), ('encrypt', 2)]
+
+
+def test_executor_error(sm2_s, monkeypatch):
+    def broken(*_):
+        raise RuntimeError('executor failed')
+
+    monkeypatch.setattr(sm2.aio, 'run_batch', broken)
+
+    async def main():
+        asy = AsyncSM2(sm2_s)
+        return await asyncio.gather(*(asy.sign(b'x') for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,111 @@
+''' ASN.1编解码及严格(DER)模式 '''
+import mmap
+import pytest
+from sm2 import SM2, ASN1Error
+from sm2.sm2 import ASN1
+
+MESSAGE = b'asn1 strict'
+
+
+@pytest.fixture(name='sm2_s', scope='module')
+def fixture_sm2_s():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.fixture(name='signed', scope='module')
+def fixture_signed(sm2_s):
+    ''' r的首字节小于0x80的签名(r, s), 便于构造带多余前导0的整数 '''
+    while True:
+        signed = sm2_s.sign(MESSAGE)
+        rrr, pos = ASN1.read_int(signed, 2)
+        sss, _ = ASN1.read_int(signed, pos)
+        if signed[4] < 0x80 and signed[4] != 0:
+            return rrr, sss
+
+
+def raw_int(content):
+    return b'\x02' + ASN1.encode_length(len(content)) + content
+
+
+def sequence(body, length=None):
+    return b'\x30' + (length or ASN1.encode_length(len(body))) + body
+
+
+def variants(rrr, sss):
+    ''' 内容相同但不符合DER规则的编码 '''
+    rint, sint = ASN1.encode_int(rrr), ASN1.encode_int(sss)
+    body = rint + sint
+    rbytes = rint[2:]
+    return {
+        'long length': sequence(body, b'\x81' + bytes([len(body)])),
+        'padded length': sequence(body, b'\x82\x00' + bytes([len(body)])),
+        'int long length': sequence(b'\x02\x81' + bytes([len(rbytes)]) + rbytes + sint),
+        'padded int': sequence(raw_int(b'\x00' + rbytes) + sint),
+        'padded int 2': sequence(raw_int(b'\x00\x00' + rbytes) + sint),
+    }
+
+
+def test_der_accepted(sm2_s, signed, monkeypatch):
+    data = sequence(ASN1.encode_int(signed[0]) + ASN1.encode_int(signed[1]))
+    assert sm2_s.verify(data, MESSAGE)
+    monkeypatch.setattr(ASN1, 'STRICT', True)
+    assert sm2_s.verify(data, MESSAGE)
+    assert all(sm2_s.verify(sm2_s.sign(MESSAGE), MESSAGE) for _ in range(20))
+
+
+@pytest.mark.parametrize('name', ['long length', 'padded length', 'int long length',
+                                  'padded int', 'padded int 2'])
+def test_strict_signature(sm2_s, signed, monkeypatch, name):
+    data = variants(*signed)[name]
+    assert sm2_s.verify(data, MESSAGE)
+    monkeypatch.setattr(ASN1, 'STRICT', True)
+    with pytest.raises(ASN1Error):
+        sm2_s.verify(data, MESSAGE)
+    assert SM2.verify_multi([(sm2_s, data, MESSAGE)]) == [False]
+
+
+@pytest.mark.parametrize('content', [b'', b'\x80', b'\xff\x01', b'\x00\x7f'])
+def test_strict_int(content):
+    data = raw_int(content)
+    ASN1.read_int(data, 0)
+    with pytest.raises(ASN1Error):
+        ASN1.read_int(data, 0, True)
+    assert ASN1.read_int(raw_int(b'\x00\x80'), 0, True) == (0x80, 4)
+    assert ASN1.read_int(raw_int(b'\x00'), 0, True) == (0, 3)
+
+
+def test_strict_ciphertext(sm2_s, monkeypatch):
+    ciphertext = sm2_s.encrypt(MESSAGE)
+    start, end = ASN1.read_tlv(ciphertext, 0, 0x30)
+    body = ciphertext[start:end]
+    data = sequence(body, b'\x82' + len(body).to_bytes(2, 'big'))
+    assert sm2_s.decrypt(data) == MESSAGE
+    monkeypatch.setattr(ASN1, 'STRICT', True)
+    assert sm2_s.decrypt(ciphertext) == MESSAGE
+    with pytest.raises(ASN1Error):
+        sm2_s.decrypt(data)
+
+
+@pytest.mark.parametrize('mode', ['asn1', 'c1c3c2', 'c1c2c3', 'c1c2'])
+@pytest.mark.parametrize('kind', ['bytearray', 'memoryview', 'mmap'])
+def test_decrypt_buffer(sm2_s, mode, kind):
+    plaintext = bytes(range(256)) * 20
+    ciphertext = sm2_s.encrypt(plaintext, mode)
+    if kind == 'bytearray':
+        data = bytearray(ciphertext)
+    elif kind == 'memoryview':
+        data = memoryview(bytearray(ciphertext))
+    else:
+        data = mmap.mmap(-1, len(ciphertext))
+        data.write(ciphertext)
+    # 密文C2以memoryview引用原数据, 不复制
+    # pylint: disable=protected-access
+    _, view, _ = SM2._decode_ciphertext_asn1(data) if mode == 'asn1' \
+        else SM2._decode_ciphertext(data, mode)
+    assert view.obj is (data.obj if kind == 'memoryview' else data)
+    assert bytes(view) in ciphertext
+    view.release()
+    assert sm2_s.decrypt(data, mode) == plaintext
+    if kind == 'mmap':
+        data.close()
@@ -0,0 +1,26 @@
+''' 大整数运算后端: 分别以SM2_BACKEND=python及gmpy2在子进程中执行签名/加密等测试 '''
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS = ['tests/test_sm2.py', 'tests/test_stream.py', 'tests/test_engine.py']
+CHECK = '''
+import sys
+from sm2.fieldp import FP
+assert FP.BACKEND == sys.argv[1], FP.BACKEND
+assert ('gmpy2' in sys.modules) == (sys.argv[1] == 'gmpy2')
+'''
+
+
+@pytest.mark.parametrize('backend', ['python', 'gmpy2'])
+def test_backend(backend):
+    if backend == 'gmpy2':
+        pytest.importorskip('gmpy2')
+    env = dict(os.environ, SM2_BACKEND=backend)
+    subprocess.run([sys.executable, '-c', CHECK, backend], env=env, cwd=ROOT, check=True)
+    result = subprocess.run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider']
+                            + TESTS, env=env, cwd=ROOT, capture_output=True, text=True,
+                            check=False)
+    assert result.returncode == 0, result.stdout + result.stderr
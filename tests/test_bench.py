@@ -0,0 +1,13 @@
+''' 性能测试脚本的命令行 '''
+import pytest
+from sm2.bench import BENCHES, main
+
+
+def test_unknown_name(capsys):
+    with pytest.raises(SystemExit) as exc:
+        main(['no-such-bench'])
+    assert exc.value.code == 2
+    error = capsys.readouterr().err
+    assert 'invalid choice: no-such-bench' in error
+    assert all(name in error for name in BENCHES)
+
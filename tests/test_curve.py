@@ -0,0 +1,128 @@
+''' 椭圆曲线参数及基点缓存 '''
+import pytest
+from sm2.curve import CacheError, env_window
+from sm2.engine import wnaf
+from sm2.sm2 import CurveSM2
+
+
+@pytest.mark.parametrize('value, expect', [(None, 8), ('4', 4), ('16', 16), ('abc', 8),
+                                           ('0', 8), ('17', 8), ('', 8)])
+def test_env_window(monkeypatch, value, expect):
+    if value is None:
+        monkeypatch.delenv('SM2_CACHE_WINDOW', raising=False)
+    else:
+        monkeypatch.setenv('SM2_CACHE_WINDOW', value)
+    if expect == 8 and value is not None:
+        with pytest.warns(UserWarning):
+            assert env_window('SM2_CACHE_WINDOW') == expect
+    else:
+        assert env_window('SM2_CACHE_WINDOW') == expect
+
+
+@pytest.fixture(name='table', scope='module')
+def fixture_table():
+    ''' 窗口宽度为4的基点表 '''
+    return CurveSM2.create_cache(CurveSM2.BASE, 4)
+
+
+def test_cache_roundtrip(tmp_path, table):
+    path = str(tmp_path / 'base.cache')
+    CurveSM2.save_cache(path, table, CurveSM2.BASE)
+    loaded = CurveSM2.load_cache(path, CurveSM2.BASE)
+    assert (loaded.window, loaded.rows) == (table.window, table.rows)
+    assert loaded.tobytes() == table.tobytes()
+    for kkk in (1, 2, CurveSM2.N - 1, CurveSM2.random()):
+        assert CurveSM2.tmul(loaded, kkk) == CurveSM2.BASE * kkk
+
+
+@pytest.mark.parametrize('damage', ['magic', 'version', 'rows', 'params', 'digest', 'body',
+                                    'truncated', 'extra'])
+def test_cache_rejected(tmp_path, table, damage):
+    path = tmp_path / 'base.cache'
+    CurveSM2.save_cache(str(path), table, CurveSM2.BASE)
+    data = bytearray(path.read_bytes())
+    hlen = CurveSM2.CACHE_HEADER.size
+    if damage == 'truncated':
+        del data[-1:]
+    elif damage == 'extra':
+        data.extend(b'\x00')
+    else:
+        pos = {'magic': 0, 'version': 4, 'rows': 7, 'params': 8, 'digest': 40,
+               'body': hlen + 100}[damage]
+        data[pos] ^= 1
+    path.write_bytes(bytes(data))
+    with pytest.raises(CacheError):
+        CurveSM2.load_cache(str(path), CurveSM2.BASE)
+
+
+def test_cache_other_base(tmp_path, table):
+    path = str(tmp_path / 'base.cache')
+    CurveSM2.save_cache(path, table, CurveSM2.BASE)
+    with pytest.raises(CacheError):
+        CurveSM2.load_cache(path, CurveSM2.BASE * 2)
+
+
+def test_init_cache_window(tmp_path, table, monkeypatch):
+    path = str(tmp_path / 'base.cache')
+    CurveSM2.save_cache(path, table, CurveSM2.BASE)
+    monkeypatch.setattr(CurveSM2, 'CACHE', None)
+    monkeypatch.setattr(CurveSM2, 'CACHE_FILE', path)
+    monkeypatch.setattr(CurveSM2, 'CACHE_PACKAGED', None)
+
+    monkeypatch.setattr(CurveSM2, 'CACHE_WINDOW', 4)
+    assert CurveSM2.init_cache().tobytes() == table.tobytes()
+
+    monkeypatch.setattr(CurveSM2, 'CACHE', None)
+    monkeypatch.setattr(CurveSM2, 'CACHE_WINDOW', 5)
+    with pytest.warns(UserWarning, match='window 4'):
+        cache = CurveSM2.init_cache()
+    assert cache.window == 5
+    assert CurveSM2.tmul(cache, 12345) == CurveSM2.BASE * 12345
+
+
+def test_init_cache_writes_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'new.cache')
+    monkeypatch.setattr(CurveSM2, 'CACHE', None)
+    monkeypatch.setattr(CurveSM2, 'CACHE_FILE', path)
+    monkeypatch.setattr(CurveSM2, 'CACHE_PACKAGED', None)
+    monkeypatch.setattr(CurveSM2, 'CACHE_WINDOW', 3)
+    cache = CurveSM2.init_cache()
+    assert CurveSM2.load_cache(path, CurveSM2.BASE).tobytes() == cache.tobytes()
+
+
+def reference_mul(point, kkk):
+    ''' 原有的倍乘: 标准射影坐标系的倍点/点加(fast_double/fast_add), 逐位计算 '''
+    result = CurveSM2.ZERO.copy()
+    for bit in f'{kkk % CurveSM2.N:b}':
+        result.fast_double()
+        if bit == '1':
+            result.fast_add(point)
+    return result.to_affine()
+
+
+SCALARS = [0, 1, 2, 3, CurveSM2.N - 1, CurveSM2.N, CurveSM2.N + 1] + \
+          [CurveSM2.random() for _ in range(4)]
+
+
+@pytest.mark.parametrize('width', [2, 3, 4, 5, 6])
+def test_wmul(width):
+    point = reference_mul(CurveSM2.BASE, CurveSM2.random())
+    for kkk in SCALARS:
+        assert point.wmul(kkk, width) == reference_mul(point, kkk)
+    assert (point * SCALARS[-1]) == reference_mul(point, SCALARS[-1])
+
+
+@pytest.mark.parametrize('width', [2, 3, 5, 8])
+def test_wnaf(width):
+    for kkk in SCALARS[1:]:
+        digits = wnaf(kkk, width)
+        assert sum(digit << i for i, digit in enumerate(digits)) == kkk
+        assert all(digit == 0 or digit & 1 and abs(digit) < 1 << (width - 1)
+                   for digit in digits)
+
+
+def test_gmul_mul_many():
+    points = [reference_mul(CurveSM2.BASE, CurveSM2.random()) for _ in range(3)]
+    for kkk in SCALARS:
+        assert CurveSM2.gmul(kkk) == reference_mul(CurveSM2.BASE, kkk)
+        assert CurveSM2.mul_many(points, kkk) == [reference_mul(point, kkk) for point in points]
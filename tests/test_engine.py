@@ -0,0 +1,131 @@
+''' 运算引擎(标准射影/Jacobian坐标系)与Curve原有运算的交叉校验 '''
+import random
+import pytest
+from sm2.fieldp import FP
+from sm2.engine import ProjectiveEngine, JacobianEngine
+from sm2.sm2 import CurveSM2
+
+P = CurveSM2.P
+RND = random.Random(20240601)
+ENGINES = [ProjectiveEngine(CurveSM2.P, CurveSM2.A), JacobianEngine(CurveSM2.P, CurveSM2.A)]
+
+
+def random_point():
+    ''' 随机x坐标求出的曲线上的点, 不经过运算引擎 '''
+    while True:
+        coord_x = RND.randrange(1, P)
+        f_x = ((coord_x*coord_x + CurveSM2.A)*coord_x + CurveSM2.B) % P
+        if FP.is_square(P, f_x):
+            return CurveSM2(coord_x, FP.sqrtp(P, f_x, RND.getrandbits(1)))
+
+
+def to_engine(engine, point):
+    ''' 转换为运算引擎的坐标元组, z为随机值 '''
+    if point.coord_x == 0 and point.coord_y == 0:
+        return engine.INF
+    c1z = RND.randrange(2, P)
+    return engine.from_projective(
+        (point.coord_x * c1z % P, point.coord_y * c1z % P, c1z))
+
+
+def affine(point):
+    ''' Curve对象的仿射坐标 '''
+    return point.coord_x, point.coord_y
+
+
+def cases():
+    ''' (P, Q)组合: 随机点, P+P, P+(-P), 无穷远点 '''
+    pairs = [(random_point(), random_point()) for _ in range(8)]
+    point = random_point()
+    pairs.extend([(point, point), (point, -point), (CurveSM2.ZERO, point),
+                  (point, CurveSM2.ZERO), (CurveSM2.ZERO, CurveSM2.ZERO)])
+    return pairs
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_double(engine):
+    for point in [random_point() for _ in range(8)] + [CurveSM2.ZERO]:
+        expect = point + point
+        assert engine.to_affine(engine.double(to_engine(engine, point))) == affine(expect)
+        if point.coord_x or point.coord_y:
+            assert affine(point.copy().fast_double().to_affine()) == affine(expect)
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_add(engine):
+    for point1, point2 in cases():
+        expect = point1 + point2
+        result = engine.add(to_engine(engine, point1), to_engine(engine, point2))
+        assert engine.to_affine(result) == affine(expect)
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_madd(engine):
+    for point1, point2 in cases():
+        if point2.coord_x == 0 and point2.coord_y == 0:
+            continue
+        expect = point1 + point2
+        result = engine.madd(to_engine(engine, point1), point2.coord_x, point2.coord_y)
+        assert engine.to_affine(result) == affine(expect)
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_fast_add(engine):
+    for point1, point2 in cases()[:8]:
+        expect = point1.copy().fast_add(point2).to_affine()
+        result = engine.add(to_engine(engine, point1), to_engine(engine, point2))
+        assert engine.to_affine(result) == affine(expect)
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_to_affine(engine):
+    points = [random_point() for _ in range(8)]
+    points.insert(3, CurveSM2.ZERO)
+    tuples = [to_engine(engine, point) for point in points]
+    assert [engine.to_affine(point) for point in tuples] == [affine(point) for point in points]
+    assert engine.batch_affine(tuples) == [affine(point) for point in points]
+    assert engine.batch_affine([]) == []
+
+
+class Counted(int):
+    ''' 统计两个大数相乘次数的整数(乘以小常数及移位不计) '''
+    __slots__ = []
+    MULS = [0]
+
+    def __mul__(self, other):
+        if abs(self) >> 32 and abs(other) >> 32:
+            Counted.MULS[0] += 1
+        return Counted(int(self) * int(other))
+
+    __rmul__ = __mul__
+
+    def __add__(self, other):
+        return Counted(int(self) + int(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Counted(int(self) - int(other))
+
+    def __rsub__(self, other):
+        return Counted(int(other) - int(self))
+
+    def __lshift__(self, other):
+        return Counted(int(self) << int(other))
+
+    def __mod__(self, other):
+        return Counted(int(self) % int(other))
+
+
+@pytest.mark.parametrize('engine', ENGINES, ids=lambda engine: type(engine).__name__)
+def test_mul_cost(engine):
+    ''' MUL_COST与实际的模乘次数一致(运算统计用于估算模乘总数) '''
+    counting = type(engine)(P, Counted(CurveSM2.A))
+    point1 = tuple(Counted(value) for value in to_engine(engine, random_point()))
+    point2 = tuple(Counted(value) for value in to_engine(engine, random_point()))
+    c2x, c2y = (Counted(value) for value in affine(random_point()))
+    calls = {'double': (point1,), 'add': (point1, point2), 'madd': (point1, c2x, c2y)}
+    for name, args in calls.items():
+        Counted.MULS[0] = 0
+        getattr(counting, name)(*args)
+        assert Counted.MULS[0] == engine.MUL_COST[name], name
@@ -0,0 +1,128 @@
+''' 素数域运算: Solinas约简, 模逆/模幂的各实现 '''
+import os
+import pickle
+import random
+import subprocess
+import sys
+import pytest
+from sm2.fieldp import FP, SolinasPrime
+from sm2.sm2 import CurveSM2
+
+P = CurveSM2.P
+N = CurveSM2.N
+RND = random.Random(20240602)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOLINAS = SolinasPrime(P, FP.solinas_terms(P))
+
+
+def test_solinas_terms():
+    terms = FP.solinas_terms(P)
+    assert (1 << P.bit_length()) - sum(sign << shift for shift, sign in terms) == P
+    assert FP.solinas_terms(N) is None
+
+
+@pytest.mark.parametrize('bits', [1, 64, 255, 256, 257, 320, 384, 512, 520])
+def test_solinas_random(bits):
+    for _ in range(200):
+        value = RND.getrandbits(bits)
+        assert value % SOLINAS == int.__mod__(value, P)
+        assert -value % SOLINAS == int.__mod__(-value, P)
+
+
+@pytest.mark.parametrize('value', [0, 1, P - 1, P, P + 1, 2 * P, 2 * P - 1, P * P,
+                                   (P - 1) * (P - 1), (1 << 520) - 1, -1, -P, -2 * P - 1,
+                                   -(1 << 520)])
+def test_solinas_edges(value):
+    assert value % SOLINAS == int.__mod__(value, P)
+    assert isinstance(value % SOLINAS, int)
+
+
+def test_solinas_pickle():
+    copy = pickle.loads(pickle.dumps(SOLINAS))
+    assert copy == P and copy.terms == SOLINAS.terms
+    assert (P + 5) % copy == 5
+
+
+@pytest.mark.parametrize('reduce', ['solinas', 'mod'])
+def test_curve_reduce(reduce):
+    ''' 在子进程中以SM2_REDUCE=solinas/mod执行曲线及运算引擎的测试 '''
+    env = dict(os.environ, SM2_REDUCE=reduce, SM2_BACKEND='python')
+    prime_type = 'SolinasPrime' if reduce == 'solinas' else 'int'
+    check = ('from sm2.sm2 import CurveSM2; '
+             f'assert type(CurveSM2.ENGINE.prime).__name__ == {prime_type!r}')
+    subprocess.run([sys.executable, '-c', check], env=env, cwd=ROOT, check=True)
+    result = subprocess.run([sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider',
+                             'tests/test_curve.py', 'tests/test_engine.py'],
+                            env=env, cwd=ROOT, capture_output=True, text=True, check=False)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+@pytest.mark.parametrize('num', [P, N])
+def test_invn(num):
+    values = [0, 1, 2, num - 1, num, num + 1, 2 * num] + [RND.randrange(num) for _ in range(50)]
+    for value in values:
+        expect = FP.invn_euclid(num, value)
+        assert FP.invn_pow(num, value) == expect
+        assert FP.invn(num, value) == expect
+        if value % num:
+            assert expect * value % num == 1
+        else:
+            assert expect == 0
+
+
+@pytest.mark.parametrize('num', [P, N])
+def test_pown(num):
+    values = [0, 1, 2, num - 1] + [RND.randrange(num) for _ in range(20)]
+    exps = [1, 2, 3, num - 2, num >> 2, RND.getrandbits(256)]
+    for value in values:
+        for exp in exps:
+            expect = pow(value, exp, num)
+            assert FP.pown_square(num, value, exp) == expect
+            assert FP.pown_pow(num, value, exp) == expect
+            assert FP.pown(num, value, exp) == expect
+
+
+def test_gmpy_candidates():
+    if FP.BACKEND != 'gmpy2':
+        pytest.skip('gmpy2 backend not active')
+    for value in [0, 1, P - 1, P] + [RND.randrange(P) for _ in range(20)]:
+        assert FP.invn_gmpy(P, value) == FP.invn_euclid(P, value)
+        assert FP.pown_gmpy(P, value, P >> 2) == pow(value, P >> 2, P)
+
+
+@pytest.mark.parametrize('values', [[], [0], [0, 0], [5], [0, 3, 0, P - 1, 0],
+                                    [P, 7, 2 * P], [RND.randrange(P) for _ in range(30)]])
+def test_batch_invn(values):
+    assert FP.batch_invn(P, values) == [FP.invn_euclid(P, value % P) for value in values]
+
+
+def test_sqrtp():
+    for _ in range(20):
+        root = RND.randrange(1, P)
+        square = root * root % P
+        for sign in (0, 1):
+            result = FP.sqrtp(P, square, sign)
+            assert result * result % P == square and result & 1 == sign
+    assert FP.is_square(P, 4) and not FP.is_square(P, P - 1)
+
+
+def test_select():
+    calls = []
+
+    def good(value):
+        calls.append('good')
+        return value + 1
+
+    def wrong(value):
+        calls.append('wrong')
+        return value + 2
+
+    def slow(value):
+        calls.append('slow')
+        sum(range(10000))
+        return value + 1
+
+    assert FP.select([good, wrong], 1, rounds=5) is good
+    assert calls.count('wrong') == 1      # 结果不一致的候选只调用一次, 不计时
+    assert FP.select([slow, wrong, good], 1, rounds=5) is good
+    assert FP.select([wrong, good], 1, rounds=5) is wrong
@@ -0,0 +1,71 @@
+''' 密钥派生函数及异或运算 '''
+import os
+import pytest
+from sm3 import sm3_hash
+import sm2.kdf
+from sm2.kdf import KeyStream, SM3Buffer, kdf, bitxor, sm3_new
+
+LENGTHS = [0, 1, 31, 32, 33, 100, 4095, 4096, 4097, 5000]
+Z_BITS = bytes(range(64))
+
+
+def reference_kdf(z_bits, klen):
+    ''' 原来的实现: 逐块计算SM3(Z || ct)并拼接 '''
+    result = b''
+    counter = 1
+    while len(result) < klen:
+        result += sm3_hash(z_bits + counter.to_bytes(4, 'big'))
+        counter += 1
+    return result[:klen]
+
+
+def reference_xor(data1, data2):
+    return bytes(byte1 ^ byte2 for byte1, byte2 in zip(data1, data2))
+
+
+@pytest.mark.parametrize('klen', LENGTHS)
+def test_kdf(klen):
+    assert kdf(Z_BITS, klen) == reference_kdf(Z_BITS, klen)
+
+
+@pytest.mark.parametrize('incremental', [True, False])
+def test_keystream(monkeypatch, incremental):
+    if incremental and not sm2.kdf.SM3_INCREMENTAL:
+        pytest.skip('hashlib does not support SM3')
+    monkeypatch.setattr(sm2.kdf, 'SM3_INCREMENTAL', incremental)
+    expect = reference_kdf(Z_BITS, 6000)
+    for sizes in ([1] * 70, [31, 33, 0, 64, 5], [4097, 1, 1000], [7] * 800):
+        stream = KeyStream(Z_BITS)
+        result = b''.join(stream.read(size) for size in sizes)
+        assert result == expect[:len(result)]
+
+
+def test_sm3_buffer():
+    hasher = SM3Buffer(b'abc')
+    copy = hasher.copy()
+    hasher.update(b'def')
+    assert copy.digest() == sm3_hash(b'abc')
+    assert hasher.digest() == sm3_hash(b'abcdef') == sm3_new(b'abcdef').digest()
+
+
+@pytest.mark.parametrize('length', LENGTHS)
+def test_bitxor(monkeypatch, length):
+    data1 = os.urandom(length)
+    data2 = os.urandom(length + 7)
+    expect = reference_xor(data1, data2)
+    assert bitxor(data1, data2) == bitxor(data2, data1) == expect
+    assert bitxor(bytearray(data1), memoryview(data2)) == expect
+    monkeypatch.setattr(sm2.kdf, 'numpy', None)
+    assert bitxor(data1, data2) == expect
+
+
+@pytest.mark.parametrize('length', [4095, 4096, 4097, 4096 + 31, 10000])
+def test_bitxor_numpy(monkeypatch, length):
+    pytest.importorskip('numpy')
+    data1 = os.urandom(length)
+    data2 = bytearray(os.urandom(length))
+    numpy_result = bitxor(data1, data2)
+    monkeypatch.setattr(sm2.kdf, 'XOR_NUMPY_MIN', 1 << 30)
+    assert numpy_result == bitxor(data1, data2) == reference_xor(data1, data2)
+    monkeypatch.setattr(sm2.kdf, 'XOR_NUMPY_MIN', 1)
+    assert bitxor(data1[:33], data2[:33]) == reference_xor(data1[:33], data2[:33])
@@ -0,0 +1,112 @@
+''' 公钥批量加载 '''
+import pytest
+from sm2 import SM2
+from sm2.curve import CurveError
+from sm2.fieldp import FP
+from sm2.keys import KeyLoader
+from sm2.sm2 import CurveSM2
+
+
+@pytest.fixture(name='loader')
+def fixture_loader():
+    return KeyLoader(CurveSM2)
+
+
+@pytest.fixture(name='points', scope='module')
+def fixture_points():
+    # 包含y为奇数及偶数的点
+    points = []
+    while len(points) < 8 or len({point.coord_y & 1 for point in points}) < 2:
+        points.append(SM2.create_private_key().public_key())
+    return points
+
+
+def encodings(point):
+    raw = point.bytes_x + point.bytes_y
+    return [bytes(point), point.to_bytes(True), raw,
+            bytes([6 | point.coord_y & 1]) + raw, bytearray(bytes(point))]
+
+
+def off_curve(point):
+    return b'\x04' + point.bytes_x + (point.coord_y ^ 1).to_bytes(32, 'big')
+
+
+def test_formats(loader, points):
+    for point in points:
+        loaded = loader.load(encodings(point))
+        assert all(item == point and item.coord_z == 1 for item in loaded)
+        assert loader.point(point.to_bytes(True)) == point
+    # 同一编码只校验一次
+    assert loader.stats['misses'] == len(points) * 4
+    assert loader.stats['hits'] == len(points) * 2
+    assert SM2.load_public_keys([bytes(points[0])]) == [points[0]]
+
+
+def test_compact(loader, points):
+    datas = [point.to_bytes(index & 1 == 0) for index, point in enumerate(points)]
+    array = loader.load(datas, compact=True)
+    assert len(array) == len(points) and array.invalid == []
+    assert [array[index] for index in range(len(points))] == \
+           [(point.coord_x, point.coord_y) for point in points]
+    assert array[-1] == (points[-1].coord_x, points[-1].coord_y)
+    assert array.tobytes() == b''.join(bytes(point)[1:] for point in points)
+    with pytest.raises(IndexError):
+        array[len(points)]          # pylint: disable=pointless-statement
+
+
+@pytest.mark.parametrize('kind', ['off curve', 'compressed off curve', 'infinity',
+                                  'infinity raw', 'hybrid parity', 'x too large',
+                                  'length', 'prefix', 'type'])
+def test_invalid(loader, points, kind):
+    point = points[0]
+    if kind == 'off curve':
+        data = off_curve(point)
+    elif kind == 'compressed off curve':
+        # 找一个不在曲线上的x
+        coord_x, prime = point.coord_x, CurveSM2.P
+        while FP.is_square(prime, (coord_x ** 3 + CurveSM2.A * coord_x + CurveSM2.B) % prime):
+            coord_x += 1
+        data = b'\x02' + coord_x.to_bytes(32, 'big')
+    elif kind == 'infinity':
+        data = bytes(CurveSM2.ZERO)
+    elif kind == 'infinity raw':
+        data = b'\x04' + bytes(64)
+    elif kind == 'hybrid parity':
+        data = bytes([7 - (point.coord_y & 1)]) + point.bytes_x + point.bytes_y
+    elif kind == 'x too large':
+        data = b'\x03' + CurveSM2.P.to_bytes(32, 'big')
+    elif kind == 'length':
+        data = bytes(point)[:-1]
+    elif kind == 'prefix':
+        data = b'\x05' + bytes(point)[1:]
+    else:
+        data = None
+    error = TypeError if kind == 'type' else (ValueError, CurveError)
+    with pytest.raises(error):
+        loader.load([data])
+    good = bytes(points[1])
+    assert loader.load([good, data, good], errors='skip') == [points[1], None, points[1]]
+    array = loader.load([data, good, data], compact=True, errors='skip')
+    assert array.invalid == [0, 2]
+    assert array[0] == array[2] == (0, 0) and array[1] == (points[1].coord_x, points[1].coord_y)
+    with pytest.raises(ValueError):
+        loader.load([good], errors='ignore')
+
+
+def test_infinity_public_key(points):
+    with pytest.raises(CurveError):
+        SM2.create_public_key(b'\x04' + bytes(64))
+    with pytest.raises((ValueError, CurveError)):
+        SM2(bytes(CurveSM2.ZERO))
+    assert SM2.load_public_keys([bytes(CurveSM2.ZERO), bytes(points[0])],
+                                errors='skip') == [None, points[0]]
+
+
+def test_cache_limit(points):
+    loader = KeyLoader(CurveSM2, maxsize=3)
+    loader.load([bytes(point) for point in points])
+    assert loader.stats == {'keys': 3, 'hits': 0, 'misses': len(points)}
+    loader.load([bytes(points[-1])])
+    assert loader.stats['hits'] == 1
+    loader.clear()
+    assert loader.stats['keys'] == 0
@@ -0,0 +1,134 @@
+''' 签名随机数池 '''
+import gc
+import itertools
+import os
+import threading
+
+import pytest
+
+from sm2 import SM2, NoncePool
+
+
+class Counter:
+    ''' 生成不重复的编号作为随机数项, 便于检查每项只取出一次 '''
+
+    def __init__(self):
+        self.source = itertools.count(1)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, count):
+        with self.lock:
+            self.calls.append(count)
+            return [(next(self.source), 0) for _ in range(count)]
+
+
+def test_take_once_threads():
+    create = Counter()
+    pool = NoncePool(create, size=64, low=16, batch=8)
+    taken = []
+
+    def worker():
+        for _ in range(500):
+            if (entry := pool.take()) is not None:
+                taken.append(entry[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    assert taken and len(taken) == len(set(taken))
+    assert pool.stats['hits'] == len(taken)
+    assert pool.stats['hits'] + pool.stats['misses'] == 4000
+
+
+def test_inline_refill():
+    create = Counter()
+    pool = NoncePool(create, size=10, low=4, batch=3, refill='inline')
+    assert len(pool) == 0 and pool.take() is None
+    assert len(pool) == 10 and create.calls == [3, 3, 3, 1]
+    values = [pool.take()[0] for _ in range(20)]
+    assert len(set(values)) == 20
+    assert pool.stats['misses'] == 1
+    pool.close()
+    assert len(pool) == 0 and pool.take() is None
+
+
+def test_callback_refill():
+    create = Counter()
+    seen = []
+    pool = NoncePool(create, size=8, low=2, refill=lambda pool: seen.append(len(pool)))
+    assert pool.take() is None and seen == [0]
+    pool.fill()
+    assert len(pool) == 8 and create.calls == [8]
+    for _ in range(6):
+        pool.take()
+    assert seen == [0]
+    pool.take()
+    assert seen == [0, 1]
+    pool.fill(3)
+    assert len(pool) == 4
+
+
+def test_thread_refill():
+    create = Counter()
+    pool = NoncePool(create, size=16, low=4, batch=4)
+    for _ in range(100):
+        if pool.take() is None:
+            pool.thread.join(0.01)
+    pool.close()
+    pool.thread.join(1)
+    assert not pool.thread.is_alive()
+
+
+def test_dropped_pool_stops_thread():
+    pool = NoncePool(Counter(), size=16)
+    thread = pool.thread
+    del pool
+    gc.collect()
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def test_after_fork_simulated():
+    pool = NoncePool(Counter(), size=8, refill='inline')
+    pool.fill()
+    pool.pid = -1                   # 模拟fork后的子进程
+    first = pool.take()
+    assert pool.pid == os.getpid()
+    assert first is None and pool.stats['misses'] == 1
+    assert len(pool) == 8
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires fork')
+def test_after_fork():
+    pool = NoncePool(Counter(), size=8, refill='inline')
+    pool.fill()
+    inherited = {entry[0] for entry in pool.entries}
+    reader, writer = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            first = pool.take()
+            os.write(writer, b'1' if first is None or first[0] not in inherited else b'0')
+        finally:
+            os._exit(0)
+    os.close(writer)
+    result = os.read(reader, 1)
+    os.close(reader)
+    os.waitpid(pid, 0)
+    assert result == b'1'
+    assert {entry[0] for entry in pool.entries} == inherited
+
+
+def test_sign_with_pool():
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key(), private_key)
+    pool = sm2.enable_nonce_pool(size=4, refill='inline')
+    sign1 = sm2.sign(b'nonce pool')
+    sign2 = sm2.sign(b'nonce pool')
+    assert sign1 != sign2
+    assert sm2.verify(sign1, b'nonce pool') and sm2.verify(sign2, b'nonce pool')
+    assert sm2.enable_nonce_pool(NoncePool(SM2.create_nonces, refill='inline')) is not pool
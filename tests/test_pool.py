@@ -0,0 +1,78 @@
+''' 多进程运算池 '''
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import pytest
+
+from sm2 import SM2, ASN1Error
+from sm2.pool import SM2Pool, run_batch
+
+
+@pytest.fixture(name='sm2_s', scope='module')
+def fixture_sm2_s():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.fixture(name='pool', scope='module')
+def fixture_pool(sm2_s):
+    with SM2Pool(sm2_s.public_key, sm2_s.private_key, max_workers=2, chunksize=3) as pool:
+        yield pool
+
+
+def test_map_order(sm2_s, pool):
+    datas = [bytes([idx]) * idx for idx in range(1, 21)]
+    signs = list(pool.map('sign', datas))
+    assert len(signs) == len(datas)
+    assert list(pool.map('verify', signs, datas)) == [True] * len(datas)
+    assert all(sm2_s.verify(sign, data) for sign, data in zip(signs, datas))
+    ciphertexts = list(pool.map('encrypt', datas, ['c1c3c2'] * len(datas), chunksize=4))
+    assert list(pool.map('decrypt', ciphertexts, ['c1c3c2'] * len(datas))) == datas
+    assert list(pool.map(len, datas)) == list(range(1, 21))
+    assert pool.submit('decrypt', sm2_s.encrypt(b'submit')).result() == b'submit'
+
+
+def test_map_error(pool):
+    with pytest.raises(ValueError):
+        pool.map('keygen', [b''])
+    with pytest.raises(ASN1Error):
+        list(pool.map('decrypt', [b'bad ciphertext']))
+
+
+def test_map_deadline():
+    futures = [Future() for _ in range(3)]
+    futures[0].set_result([1, 2])
+    start = time.monotonic()
+    results = SM2Pool._iter_results(list(futures), start + 0.2)  # pylint: disable=protected-access
+    assert next(results) == 1 and next(results) == 2
+    with pytest.raises(FutureTimeout):
+        next(results)
+    # 超时按整个map计算, 而不是每块各自等待timeout
+    assert time.monotonic() - start < 0.4
+    assert futures[2].cancelled()
+
+
+def test_run_batch(sm2_s):
+    datas = [b'a', b'b', b'c' * 100]
+    signs = run_batch(sm2_s, 'sign', [(data,) for data in datas])
+    assert run_batch(sm2_s, 'verify', list(zip(signs, datas))) == [True] * 3
+    ciphertexts = run_batch(sm2_s, 'encrypt', [(data, 'c1c2c3') for data in datas])
+    assert run_batch(sm2_s, 'decrypt', [(ct, 'c1c2c3') for ct in ciphertexts]) == datas
+    # 模式不同时逐项执行
+    chunk = [(b'x', 'asn1'), (b'y', 'c1c2')]
+    results = run_batch(sm2_s, 'encrypt', chunk)
+    assert [sm2_s.decrypt(ct, mode) for ct, (_, mode) in zip(results, chunk)] == [b'x', b'y']
+
+
+def test_run_batch_fallback(sm2_s):
+    good = sm2_s.encrypt(b'good')
+    chunk = [(good,), (b'bad',), (good, 'asn1')]
+    with pytest.raises(ASN1Error):
+        run_batch(sm2_s, 'decrypt', chunk)
+    results = run_batch(sm2_s, 'decrypt', chunk, safe=True)
+    assert results[0] == (None, b'good') and results[2] == (None, b'good')
+    assert isinstance(results[1][0], ASN1Error) and results[1][1] is None
+    # 整批出错时逐项执行
+    results = run_batch(sm2_s, 'sign', [(b'ok',), (None,)], safe=True)
+    assert results[0][0] is None and sm2_s.verify(results[0][1], b'ok')
+    assert results[1][0] is not None and results[1][1] is None
@@ -0,0 +1,96 @@
+''' 进程内公钥状态缓存 '''
+import pytest
+
+from sm2 import SM2, KeyRegistry
+
+
+def new_key():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.fixture(name='registry')
+def fixture_registry(monkeypatch):
+    ''' 替换SM2.REGISTRY: 使用2次建立窗口宽度2的表, 4次升级为窗口宽度3 '''
+    registry = KeyRegistry(SM2, levels=((4, 3), (2, 2)))
+    monkeypatch.setattr(SM2, 'REGISTRY', registry)
+    return registry
+
+
+def test_promotion(registry):
+    point = new_key().public_key
+    sm2 = registry.get(point)
+    assert not sm2.cache and sm2.user_z is not None and sm2.odds
+    assert registry.get(point) is sm2 and sm2.cache.window == 2
+    registry.get(point)
+    assert sm2.cache.window == 2
+    registry.get(point)
+    assert sm2.cache.window == 3
+    assert registry.stats == {'keys': 1, 'memory': KeyRegistry.ENTRY_BYTES + sm2.cache.nbytes,
+                              'hits': 3, 'misses': 1, 'evictions': 0, 'promotions': 2}
+
+
+def test_promotion_memory():
+    # 表超出内存上限时不升级
+    registry = KeyRegistry(SM2, levels=((1, 4),), memory=4096)
+    sm2 = registry.get(new_key().public_key)
+    assert not sm2.cache and registry.stats['promotions'] == 0
+
+
+def test_evict_maxkeys():
+    registry = KeyRegistry(SM2, levels=(), maxkeys=3)
+    points = [new_key().public_key for _ in range(5)]
+    for point in points[:3]:
+        registry.get(point)
+    registry.get(points[0])         # 最近使用, 不被淘汰
+    for point in points[3:]:
+        registry.get(point)
+    assert len(registry) == 3 and registry.stats['evictions'] == 2
+    assert set(registry.entries) == {bytes(points[0]), bytes(points[3]), bytes(points[4])}
+
+
+def test_evict_memory():
+    sizes = KeyRegistry.ENTRY_BYTES
+    table = KeyRegistry.table_bytes(new_key(), 2)
+    registry = KeyRegistry(SM2, levels=((2, 2),), memory=table + sizes * 3)
+    points = [new_key().public_key for _ in range(4)]
+    for point in points:
+        registry.get(point)
+    assert len(registry) == 4 and registry.stats['evictions'] == 0
+    # points[3]建表后超出内存上限, 淘汰最久未使用的公钥, 保留刚升级的公钥
+    sm2 = registry.get(points[3])
+    assert sm2.cache.window == 2
+    assert list(registry.entries) == [bytes(point) for point in points[1:]]
+    assert registry.stats['evictions'] == 1
+    assert registry.total == sizes * 3 + sm2.cache.nbytes == registry.memory
+    # 再有一个公钥建表时, 淘汰其它公钥直到满足上限
+    registry.get(points[1])
+    assert list(registry.entries) == [bytes(points[1])]
+    assert registry.stats['evictions'] == 3
+    registry.clear()
+    assert len(registry) == 0 and registry.total == 0
+
+
+def test_init_shared(registry):
+    sm2_s = new_key()
+    data = sm2_s.public_key.to_bytes(False)
+    signed = sm2_s.sign(b'registry')
+    first = SM2(data)
+    assert not first.cache and first.odds and first.verify(signed, b'registry')
+    second = SM2(sm2_s.public_key.to_bytes(True))
+    # 压缩编码与未压缩编码共用同一项
+    assert second.user_z is first.user_z and second.odds is first.odds
+    assert second.cache.window == 2 and second.verify(signed, b'registry')
+    assert registry.stats['keys'] == 1 and registry.stats['hits'] == 1
+    assert SM2.verify_multi([(data, signed, b'registry')] * 2) == [True, True]
+    assert SM2(data).cache.window == 3
+
+
+def test_init_not_shared(registry):
+    sm2_s = new_key()
+    data = bytes(sm2_s.public_key)
+    assert SM2(data, use_cache=False).cache is False
+    assert SM2(data, use_cache=True).cache.window == 8
+    assert SM2(sm2_s.public_key).odds is None
+    assert SM2(data, sm2_s.private_key).cache is None
+    assert len(registry) == 0
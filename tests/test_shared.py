@@ -0,0 +1,95 @@
+''' 进程间共享的预计算表 '''
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import shared_memory
+import pytest
+from sm2 import SM2, SharedTables
+from sm2.sm2 import CurveSM2
+
+WINDOW = 2
+
+
+@pytest.fixture(name='point')
+def fixture_point():
+    ''' 随机公钥, 测试结束后删除其共享表 '''
+    point = SM2.create_private_key().public_key()
+    yield point
+    SharedTables(window=WINDOW).unlink(point)
+
+
+def stale_segment(point, header):
+    ''' 预先建立一个只有段头(或无效内容)的共享内存段 '''
+    name = 'sm2_' + SharedTables(window=WINDOW).fingerprint(point)
+    shm = shared_memory.SharedMemory(name, True, 4096)
+    shm.buf[:len(header)] = header
+    return shm
+
+
+def dead_pid():
+    ''' 已退出的进程pid '''
+    proc = subprocess.Popen([sys.executable, '-c', ''])
+    proc.wait()
+    return proc.pid
+
+
+def check_table(point, table):
+    assert table.window == WINDOW
+    assert CurveSM2.tmul(table, 12345) == point * 12345
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX shared memory')
+@pytest.mark.parametrize('state', ['zero', 'garbage', 'dead', 'version', 'timeout', 'failed'])
+def test_stale_segment(point, state):
+    tables = SharedTables(window=WINDOW, timeout=0.5 if state == 'timeout' else 10)
+    if state == 'zero':
+        header = bytes(tables.SEGMENT.size)
+    elif state == 'garbage':
+        header = b'SM2T' + os.urandom(16)
+    else:
+        version = tables.SEGMENT_VERSION + (state == 'version')
+        pid = os.getpid() if state in {'timeout', 'failed'} else dead_pid()
+        header = tables.SEGMENT.pack(tables.SEGMENT_MAGIC, version,
+                                     tables.FAILED if state == 'failed' else tables.BUILDING,
+                                     pid, time.time_ns())
+    stale = stale_segment(point, header)
+    start = time.monotonic()
+    SharedTables.TABLES.clear()
+    check_table(point, tables.get(point))
+    assert time.monotonic() - start < tables.HEADER_WAIT + 2
+    stale.close()
+
+    # 段已重新生成, 其它进程可以直接连接
+    SharedTables.TABLES.clear()
+    start = time.monotonic()
+    check_table(point, tables.get(point))
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX shared memory')
+def test_build_failure(point, monkeypatch):
+    tables = SharedTables(window=WINDOW)
+    name = tables.fingerprint(point)
+
+    def broken(*_):
+        raise MemoryError('create_cache failed')
+
+    SharedTables.TABLES.clear()
+    monkeypatch.setattr(CurveSM2, 'create_cache', broken)
+    with pytest.raises(MemoryError):
+        tables.get(point)
+    # 生成失败的段已删除, 不会留下一直处于生成中的段
+    assert tables._open_shm(name) is None  # pylint: disable=protected-access
+    monkeypatch.undo()
+    start = time.monotonic()
+    check_table(point, tables.get(point))
+    assert time.monotonic() - start < 1
+
+
+def test_base_table_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(CurveSM2, 'CACHE', None)
+    point = SM2.create_private_key().public_key()
+    sm2 = SM2(point, use_cache=SharedTables(str(tmp_path), window=WINDOW))
+    assert sm2.cache.window == WINDOW
+    assert CurveSM2.CACHE.window == CurveSM2.CACHE_WINDOW
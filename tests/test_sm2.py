@@ -0,0 +1,205 @@
+''' SM2签名/验签, 加密/解密 '''
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+from sm2 import SM2, SM2Error
+from sm2.aio import AsyncSM2
+from sm2.curve import CurveError
+from sm2.instrument import Instrument, StatsSink
+from sm2.sm2 import CurveSM2
+
+
+def test_verify_multi_isolation():
+    private_key = SM2.create_private_key()
+    public_key = private_key.public_key()
+    sm2 = SM2(public_key, private_key)
+    signed = sm2.sign(b'message')
+    items = [
+        (bytes(public_key), signed, b'message'),
+        ('not bytes', signed, b'message'),
+        (bytes(public_key), signed, 'not bytes'),
+        (bytes(public_key), b'\x30\x00', b'message'),
+        (bytes(public_key), signed, b'other'),
+        (sm2, signed, b'message'),
+    ]
+    assert SM2.verify_multi(items) == [True, False, False, False, False, True]
+
+
+def test_async_rejects_process_executor():
+    private_key = SM2.create_private_key()
+    executor = ProcessPoolExecutor(1)
+    try:
+        with pytest.raises(ValueError):
+            AsyncSM2(SM2(private_key.public_key(), private_key), executor)
+    finally:
+        executor.shutdown()
+
+
+@pytest.mark.parametrize('data', [b'\x04' + bytes(64), bytes(64), b'\x00'])
+def test_reject_infinity_bytes(data):
+    with pytest.raises((CurveError, ValueError)):
+        SM2.create_public_key(data)
+    with pytest.raises((CurveError, ValueError)):
+        SM2(data)
+
+
+def test_reject_infinity_point():
+    with pytest.raises(CurveError):
+        SM2.create_public_key(0, 0)
+    with pytest.raises(SM2Error):
+        SM2(CurveSM2.ZERO)
+    with pytest.raises(SM2Error):
+        SM2(CurveSM2.ZERO.copy())
+
+
+def test_instrument_counts():
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key(), private_key)
+    sink = StatsSink()
+    with Instrument(sink):
+        signed = sm2.sign(b'message')
+        assert sm2.verify(signed, b'message')
+    for operation in ('sign', 'verify'):
+        counts = sink.stats[operation]['counts']
+        assert counts['madd'] > 0 and counts['field_mul_est'] > 0
+    assert sink.stats['verify']['counts']['double'] > 0
+
+    sink.clear()
+    eee = sm2.hasher(b'message').digest()
+    with Instrument(sink):
+        assert sm2.verify_digest(sm2.sign_digest(eee), eee)
+    assert set(sink.stats) == {'sign_digest', 'verify_digest'}
+
+
+def test_instrument_outer_counts():
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key())
+    sink = StatsSink()
+    with Instrument(sink) as instrument:
+        # batch_invn内部的invn只计为一次batch_invn
+        sm2.encrypt_many([b'a', b'b', b'c'])
+        assert instrument.costs == CurveSM2.ENGINE.MUL_COST
+    counts = sink.stats['encrypt_many']['counts']
+    assert 'invn' not in counts and counts['batch_invn'] == 2
+    assert counts['field_mul_est'] == sum(counts[name] * cost
+                                          for name, cost in instrument.costs.items())
+
+
+def reference_mul(point, kkk):
+    ''' 仿射坐标逐位倍乘(Curve.__add__), 不经过运算引擎 '''
+    result = CurveSM2.ZERO
+    for bit in f'{kkk:b}':
+        result = result + result
+        if bit == '1':
+            result = result + point
+    return result
+
+
+def test_sign_many(monkeypatch):
+    private_key = SM2.create_private_key()
+    sm2 = SM2(private_key.public_key(), private_key)
+    datas = [bytes([i]) * i for i in range(20)]
+    signs = sm2.sign_many(datas)
+    assert len(signs) == len(datas)
+    assert all(sm2.verify(signed, data) for signed, data in zip(signs, datas))
+    assert sm2.verify_many(zip(signs, datas)) == [True] * len(datas)
+
+    # 固定k时与按定义计算的签名一致: r = (e + (kG).x) mod n, s = (1 + d)^-1 (k - rd) mod n
+    kkk = CurveSM2.random()
+    monkeypatch.setattr(CurveSM2, 'random', lambda: kkk)
+    point = reference_mul(CurveSM2.BASE, kkk)
+    for data, signed in zip(datas, sm2.sign_many(datas)):
+        eee = int.from_bytes(sm2.hasher(data).digest(), 'big')
+        rrr = (eee + point.coord_x) % CurveSM2.N
+        sss = pow(1 + private_key, -1, CurveSM2.N) * (kkk - rrr * private_key) % CurveSM2.N
+        assert SM2._decode_signed_asn1(signed) == (rrr, sss)  # pylint: disable=protected-access
+
+
+MODES = ['asn1', 'c1c2c3', 'c1c3c2', 'c1c2']
+
+
+@pytest.fixture(name='sm2_pair', scope='module')
+def fixture_sm2_pair():
+    ''' (私钥对象, 只有公钥的对象) '''
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key), SM2(private_key.public_key())
+
+
+def fixed_random(monkeypatch, seed):
+    ''' 固定随机数序列, 使批量加密与逐个加密使用相同的k '''
+    values = iter(range(seed, seed + 1000))
+    monkeypatch.setattr(CurveSM2, 'random', classmethod(lambda cls: next(values)))
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('count', [3, 20])
+@pytest.mark.parametrize('branch', ['table', 'wnaf'])
+def test_encrypt_many(sm2_pair, monkeypatch, mode, count, branch):
+    sm2_s, sm2_p = sm2_pair
+    # BATCH_TABLE: 达到数量时临时建表, 否则逐个wNAF倍乘
+    monkeypatch.setattr(SM2, 'BATCH_TABLE', (1 if branch == 'table' else 1 << 30, 4))
+    plaintexts = [bytes([idx]) * (idx * 7 + 1) for idx in range(count)]
+    fixed_random(monkeypatch, 12345)
+    singles = [sm2_p.encrypt(plaintext, mode) for plaintext in plaintexts]
+    fixed_random(monkeypatch, 12345)
+    assert sm2_p.encrypt_many(plaintexts, mode) == [(None, item) for item in singles]
+    fixed_random(monkeypatch, 12345)
+    assert sm2_p.encrypt_many(iter(plaintexts), mode, safe=False) == singles
+    assert sm2_s.decrypt_many(singles, mode, safe=False) == \
+           [sm2_s.decrypt(item, mode) for item in singles] == plaintexts
+
+
+def test_encrypt_many_mixed(sm2_pair):
+    sm2_s, sm2_p = sm2_pair
+    plaintexts = [b'first', b'', 'text', None, 12, bytearray(b'last')]
+    results = sm2_p.encrypt_many(plaintexts, 'c1c3c2')
+    assert [type(error) for error, _ in results] == \
+           [type(None), SM2Error, TypeError, TypeError, TypeError, type(None)]
+    assert all(result is None for error, result in results if error is not None)
+    assert sm2_s.decrypt(results[0][1], 'c1c3c2') == b'first'
+    assert sm2_s.decrypt(results[-1][1], 'c1c3c2') == b'last'
+    with pytest.raises(SM2Error):
+        sm2_p.encrypt_many(plaintexts, 'c1c3c2', safe=False)
+    with pytest.raises(SM2Error):
+        sm2_p.encrypt_many([b'x'], 'c3c2c1')
+    assert sm2_p.encrypt_many([]) == []
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_decrypt_many_mixed(sm2_pair, mode):
+    sm2_s, sm2_p = sm2_pair
+    good = sm2_p.encrypt(b'good', mode)
+    infinity = SM2._encrypt_with(  # pylint: disable=protected-access
+        CurveSM2(0, 0), CurveSM2.BASE, b'zero', mode)
+    tampered = bytearray(good)
+    tampered[-1] ^= 1
+    datas = [good, b'', infinity, None, bytes(tampered), memoryview(good)]
+    results = sm2_s.decrypt_many(datas, mode)
+    assert len(results) == len(datas)
+    assert results[0] == results[5] == (None, b'good')
+    # c1c2没有校验值, 篡改的密文只会解出错误的明文
+    bad = (1, 2, 3) if mode == 'c1c2' else (1, 2, 3, 4)
+    for index in bad:
+        error, result = results[index]
+        assert result is None and isinstance(error, Exception)
+    assert isinstance(results[2][0], SM2Error)
+    if mode == 'c1c2':
+        assert results[4] == (None, b'gooe')
+    with pytest.raises(Exception):
+        sm2_s.decrypt_many(datas, mode, safe=False)
+    with pytest.raises(SM2Error):
+        sm2_p.decrypt_many([good], mode)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_decrypt_infinity(sm2_pair, mode):
+    ''' C1为无穷远点的密文在单个, 批量及流式解密中都被拒绝 '''
+    sm2_s, _ = sm2_pair
+    data = SM2._encrypt_with(  # pylint: disable=protected-access
+        CurveSM2(0, 0), CurveSM2.BASE, b'zero', mode)
+    with pytest.raises(SM2Error):
+        sm2_s.decrypt(data, mode)
+    assert isinstance(sm2_s.decrypt_many([data], mode)[0][0], SM2Error)
+    decryptor = sm2_s.decryptor(mode)
+    with pytest.raises(SM2Error):
+        decryptor.update(data)
+        decryptor.finalize()
@@ -0,0 +1,51 @@
+''' 流式加密/解密 '''
+import pytest
+from sm2 import SM2
+import sm2.stream
+
+MODES = ['c1c2', 'c1c2c3', 'c1c3c2', 'asn1']
+
+
+@pytest.fixture(name='sm2_s', scope='module')
+def fixture_sm2_s():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_roundtrip(sm2_s, mode):
+    plaintext = bytes(range(256)) * 40
+    enc = sm2_s.encryptor(mode)
+    ciphertext = b''.join(enc.update(plaintext[pos:pos+1000])
+                          for pos in range(0, len(plaintext), 1000)) + enc.finalize()
+    assert sm2_s.decrypt(ciphertext, mode) == plaintext
+    dec = sm2_s.decryptor(mode)
+    result = b''.join(dec.update(ciphertext[pos:pos+777])
+                      for pos in range(0, len(ciphertext), 777))
+    assert result + dec.finalize() == plaintext
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('incremental', [True, False])
+def test_buffered(sm2_s, monkeypatch, mode, incremental):
+    monkeypatch.setattr(sm2.stream, 'SM3_INCREMENTAL', incremental)
+    enc = sm2_s.encryptor(mode)
+    dec = sm2_s.decryptor(mode)
+    assert enc.holds_ciphertext == (mode in {'c1c3c2', 'asn1'})
+    assert enc.incremental == dec.incremental == (incremental or mode == 'c1c2')
+    assert enc.buffered == (enc.holds_ciphertext or not enc.incremental)
+    assert dec.buffered == (not dec.incremental)
+
+
+@pytest.mark.parametrize('incremental', [True, False])
+def test_signer_verifier(sm2_s, monkeypatch, incremental):
+    monkeypatch.setattr(sm2.stream, 'SM3_INCREMENTAL', incremental)
+    signer = sm2_s.signer()
+    for chunk in (b'abc', b'def' * 100):
+        signer.update(chunk)
+    signed = signer.sign()
+    verifier = sm2_s.verifier(signed).update(b'abc').update(b'def' * 100)
+    assert verifier.verify()
+    assert sm2_s.verify(signed, b'abc' + b'def' * 100)
+    assert signer.incremental == verifier.incremental == incremental
+    assert signer.buffered == verifier.buffered == (not incremental)
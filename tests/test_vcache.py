@@ -0,0 +1,87 @@
+''' 验签结果缓存 '''
+import pytest
+from sm2 import SM2
+from sm2.sm2 import CurveSM2
+import sm2.vcache
+from sm2.vcache import VerifyCache
+
+MESSAGE = b'verify cache'
+
+
+@pytest.fixture(name='sm2_s', scope='module')
+def fixture_sm2_s():
+    private_key = SM2.create_private_key()
+    return SM2(private_key.public_key(), private_key)
+
+
+@pytest.fixture(name='cache')
+def fixture_cache(monkeypatch):
+    ''' 启用验签缓存, 测试结束后恢复 '''
+    monkeypatch.setattr(SM2, 'VERIFY_CACHE', None)
+    return SM2.enable_verify_cache(maxsize=4)
+
+
+def test_digest_forms(sm2_s, cache):
+    signed = sm2_s.sign(MESSAGE)
+    digest = sm2_s.hasher(MESSAGE).digest()
+    eee = int.from_bytes(digest, 'big')
+    assert sm2_s.verify_digest(signed, digest)
+    assert cache.stats == {'size': 1, 'hits': 0, 'misses': 1}
+    # 整数摘要, 加上N的倍数的摘要与字节串摘要对应同一个键
+    for value in (eee, eee % CurveSM2.N, eee + CurveSM2.N, eee + (CurveSM2.N << 300)):
+        assert sm2_s.verify_digest(signed, value)
+    assert sm2_s.verify(signed, MESSAGE)
+    assert cache.stats == {'size': 1, 'hits': 5, 'misses': 1}
+    # 超出256位或为负数的整数摘要不会抛出OverflowError
+    assert not sm2_s.verify_digest(signed, -eee)
+    assert not sm2_s.verify_digest(signed, 1 << 300)
+    assert cache.stats == {'size': 1, 'hits': 5, 'misses': 3}
+
+
+def test_only_success_stored(sm2_s, cache):
+    signed = sm2_s.sign(MESSAGE)
+    for _ in range(3):
+        assert not sm2_s.verify(signed, b'other message')
+    assert len(cache) == 0 and cache.stats['misses'] == 3
+    assert SM2.verify_multi([(sm2_s, signed, b'other message')]) == [False]
+    assert len(cache) == 0
+    assert SM2.verify_multi([(sm2_s, signed, MESSAGE)] * 2) == [True, True]
+    assert len(cache) == 1
+    assert sm2_s.verify(signed, MESSAGE)
+    assert cache.stats['hits'] == 1
+
+
+def test_lru(sm2_s, cache):
+    signs = [sm2_s.sign(bytes([idx])) for idx in range(5)]
+    for idx, signed in enumerate(signs):
+        assert sm2_s.verify(signed, bytes([idx]))
+    assert len(cache) == 4
+    key = VerifyCache.key(sm2_s.public_key, signs[0],
+                          int.from_bytes(sm2_s.hasher(b'\x00').digest(), 'big') % CurveSM2.N)
+    assert not cache.get(key)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(sm2.vcache, 'monotonic', lambda: now[0])
+    cache = VerifyCache(ttl=10)
+    cache.add(('key',))
+    assert cache.get(('key',))
+    now[0] += 9.9
+    assert cache.get(('key',))
+    now[0] += 0.2
+    assert not cache.get(('key',))
+    assert len(cache) == 0
+    assert cache.stats == {'size': 0, 'hits': 2, 'misses': 1}
+    # ttl为None时不过期
+    cache = VerifyCache()
+    cache.add(('key',))
+    now[0] += 1e9
+    assert cache.get(('key',))
+
+
+def test_disable(cache):
+    assert SM2.VERIFY_CACHE is cache
+    assert SM2.enable_verify_cache(0) is None and SM2.VERIFY_CACHE is None